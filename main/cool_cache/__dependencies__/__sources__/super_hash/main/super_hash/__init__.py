@@ -1,23 +1,97 @@
 import collections
-from hashlib import md5 
+import fnmatch
+from hashlib import md5, blake2b, blake2s
+import functools
 import pickle
 import dis
+import threading
 
 LOAD_GLOBAL_CODE = 116
 code = type(compile('1','','single'))
 
+# 
+# hash algorithm
+# 
+hash_algorithms = ("md5", "blake2b", "blake2s", "xxhash")
+_hasher_factory = md5
+_hash_algorithm_tag = "md5"
+def set_hash_algorithm(algorithm="md5", digest_size=None):
+    """
+    Picks the algorithm used by consistent_hash/super_hash/hash_file (everything defaults to md5)
+        "blake2b"/"blake2s": from hashlib, digest_size defaults to 16 bytes (same length as md5)
+        "xxhash": xxh3_128 from the xxhash package (pip install xxhash), much faster but not cryptographic
+    Hashes made with different algorithms are never equal, so anything persisted should record get_hash_algorithm()
+    """
+    global _hasher_factory, _hash_algorithm_tag
+    if algorithm == "md5":
+        if digest_size not in (None, 16):
+            raise ValueError("md5 always has a digest_size of 16")
+        _hasher_factory, _hash_algorithm_tag = md5, "md5"
+    elif algorithm in ("blake2b", "blake2s"):
+        digest_size = 16 if digest_size is None else digest_size
+        constructor = blake2b if algorithm == "blake2b" else blake2s
+        if not (1 <= digest_size <= constructor.MAX_DIGEST_SIZE):
+            raise ValueError(f"digest_size for {algorithm} must be between 1 and {constructor.MAX_DIGEST_SIZE}, got {digest_size}")
+        _hasher_factory, _hash_algorithm_tag = functools.partial(constructor, digest_size=digest_size), f"{algorithm}-{digest_size}"
+    elif algorithm == "xxhash":
+        if digest_size not in (None, 16):
+            raise ValueError("xxhash (xxh3_128) always has a digest_size of 16")
+        try:
+            import xxhash
+        except ImportError as error:
+            raise ImportError("the xxhash hash algorithm needs the xxhash package: pip install xxhash") from error
+        _hasher_factory, _hash_algorithm_tag = xxhash.xxh3_128, "xxh3_128"
+    else:
+        raise ValueError(f"hash algorithm must be one of {hash_algorithms}, got {algorithm!r}")
+    # hashes of functions/builtins made with the previous algorithm
+    super_hash._non_iterable_cache.clear()
+    _canonical_hashes.clear()
+
+def get_hash_algorithm():
+    """
+    Returns a tag like "md5" or "blake2b-16" that identifies the current algorithm + digest size
+    """
+    return _hash_algorithm_tag
+
+def new_hasher(data=b""):
+    return _hasher_factory(data)
+
+# hash of a pickle -> consistent_hash of the value it came from (for pickles with dicts/sets in them), oldest are evicted first
+_canonical_hashes = {}
+_canonical_hashes_lock = threading.Lock()
+_max_canonical_hashes = 1024
+
 def consistent_hash(value):
     if isinstance(value, bytes):
-        return md5(value).hexdigest()
+        return _hasher_factory(value).hexdigest()
     
     if isinstance(value, str):
-        return md5(("@"+value).encode('utf-8')).hexdigest()
+        return _hasher_factory(("@"+value).encode('utf-8')).hexdigest()
     
     if isinstance(value, (bool, int, float, type(None))):
-        return md5(("#"+str(value)).encode('utf-8')).hexdigest()
+        return _hasher_factory(("#"+str(value)).encode('utf-8')).hexdigest()
         
+    pickled = pickle.dumps(value, protocol=4)
+    pickled_hash = _hasher_factory(pickled).hexdigest()
+    # the order of a pickled set (or dict) isn't canonical, so those are replaced with their sorted items first
+    if not isinstance(value, _streamable_containers) or not _has_unordered_opcodes(pickled):
+        return pickled_hash
+    # the same pickle always comes from the same structure, so this only needs to be worked out once per pickle
+    output = _canonical_hashes.get(pickled_hash)
+    if output is not None:
+        return output
+    canonical = _canonical_form(value)
+    if canonical is NotImplemented:
+        return stream_hash(value, new_hasher(), {}).hexdigest()
+    if canonical is value:
+        output = pickled_hash
     else:
-        return md5(pickle.dumps(value, protocol=4)).hexdigest()
+        output = _hasher_factory(pickle.dumps(canonical, protocol=4)).hexdigest()
+    with _canonical_hashes_lock:
+        _canonical_hashes[pickled_hash] = output
+        while len(_canonical_hashes) > _max_canonical_hashes:
+            del _canonical_hashes[next(iter(_canonical_hashes))]
+    return output
 
 def shallow_instruction_hash(value):
     instructions = value if type(value) == tuple else dis.get_instructions(value)
@@ -30,31 +104,125 @@ file_doesnt_exist_key = "pGVQDVYZAVeUb9oOPvWn3QbHmnpw/MGu43pI8a+Gss+QKgnbo36NfRG
 file_exists_key       = "xeWLFUZaurvdgqQA524lqQZ6BOSv+OBpQUmsSV4AmbRQG31JuMkhCZNz+XVN1HoU9wU3gezpusflZkd3kdKRwYBw"
 using_id_based        = "xeWLFUZaurvdgqQA524lqQZ6BOSv+OBpQUmsSV4AmbRQG31JuMkhCZNz+XVN1HoU9wU3gezpusflZkd3kdKRwYBw"
 hash_salt             = md5(("|"+str(-24979514859357)).encode('utf-8')).hexdigest()
-def hash_file(filepath=None, *, file=None, _block_read_size=1024):
+file_hash_formats = ("stream", "chained")
+_file_read_size = 1 << 20
+# files at least this big are hashed straight from an mmap (no read copies)
+_file_mmap_size = 8 << 20
+
+def _chained_file_hash(file, block_read_size):
+    # the original format: each 1KB block re-hashes the previous hex digest + the block
+    hash_value = file_exists_key
+    block = file.read(block_read_size)
+    while block != b"":
+        # block chain
+        hash_value = consistent_hash(bytes(hash_value, "utf-8")+block)
+        block = file.read(block_read_size)
+    return hash_value
+
+def _streamed_file_hash(file):
+    hasher = new_hasher(b"file-stream:" + file_exists_key.encode('utf-8'))
+    fileno = getattr(file, "fileno", None)
+    if fileno is not None:
+        try:
+            import mmap
+            remaining = os.fstat(fileno()).st_size - file.tell()
+            if remaining >= _file_mmap_size and file.tell() == 0:
+                with mmap.mmap(fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    hasher.update(mapped)
+                file.seek(0, os.SEEK_END)
+                return hasher.hexdigest()
+        except Exception as error:
+            # not a real file (or can't be mapped), fall back to reading it
+            pass
+    readinto = getattr(file, "readinto", None)
+    if readinto is not None:
+        buffer = bytearray(_file_read_size)
+        view = memoryview(buffer)
+        while True:
+            size = readinto(buffer)
+            if not size:
+                break
+            hasher.update(view[:size])
+    else:
+        block = file.read(_file_read_size)
+        while block:
+            hasher.update(block)
+            block = file.read(_file_read_size)
+    return hasher.hexdigest()
+
+def _matches_any(relative_path, name, patterns):
+    # patterns with a "/" match the path relative to the root, others only match the name
+    for each_pattern in patterns:
+        if fnmatch.fnmatchcase(relative_path if "/" in each_pattern else name, each_pattern):
+            return True
+    return False
+
+def hash_directory(dirpath, *, include=None, exclude=None, hash_format="stream", file_hasher=None):
+    """
+    Merkle hash of a directory: each directory hashes the sorted (name, kind, hash) of its children
+        include: glob patterns, only matching files are hashed (default: every file)
+        exclude: glob patterns, matching files and directories are skipped (a skipped directory isn't even walked)
+        patterns containing a "/" match the path relative to dirpath (ex: "raw/*.csv"), others match the name (ex: "*.tmp")
+        file_hasher(path, dir_entry): optional replacement for hash_file (ex: to reuse hashes of files that didn't change)
+    Directories without any hashed files are left out, and the name of dirpath itself isn't part of the hash.
+    """
+    include = tuple([include] if isinstance(include, str) else include or ())
+    exclude = tuple([exclude] if isinstance(exclude, str) else exclude or ())
+    if file_hasher is None:
+        file_hasher = lambda path, dir_entry: hash_file(path, hash_format=hash_format)
+    
+    def hash_node(path, relative_prefix):
+        with os.scandir(path) as entries:
+            entries = sorted(entries, key=lambda each: each.name)
+        hasher = None
+        for each in entries:
+            relative_path = relative_prefix + each.name
+            if exclude and _matches_any(relative_path, each.name, exclude):
+                continue
+            if each.is_dir(follow_symlinks=False):
+                kind, child_hash = b"d", hash_node(each.path, relative_path + "/")
+            elif each.is_symlink() and not each.is_file():
+                # dangling links and links to directories (which could loop) are hashed by their target
+                kind, child_hash = b"l", consistent_hash(os.readlink(each.path))
+            elif include and not _matches_any(relative_path, each.name, include):
+                continue
+            else:
+                kind, child_hash = b"f", file_hasher(each.path, each)
+            if child_hash is None:
+                continue
+            if hasher is None:
+                hasher = new_hasher(b"directory:" + hash_format.encode('utf-8'))
+            name = each.name.encode('utf-8', 'surrogateescape')
+            hasher.update(_pack_length(len(name)) + name + kind + child_hash.encode('utf-8'))
+        return None if hasher is None else hasher.hexdigest()
+    
+    return hash_node(dirpath, "") or new_hasher(b"empty-directory:" + hash_format.encode('utf-8')).hexdigest()
+
+def hash_file(filepath=None, *, file=None, hash_format="stream", _block_read_size=1024):
+    """
+    Hashes the contents of a file (by path, or an already-open binary file object)
+        hash_format="stream": one running digest over large reads (or an mmap for big files)
+        hash_format="chained": the original 1KB block-chain format, much slower, but it gives the
+                               same hashes as older versions (useful to keep existing caches valid)
+    The two formats never produce the same hash for the same file.
+    """
+    if hash_format not in file_hash_formats:
+        raise ValueError(f"hash_format must be one of {file_hash_formats}, got {hash_format!r}")
     if filepath:
         if os.path.isdir(filepath):
-            raise Exception(f'''filepath_hash("{filepath}") is not (yet) designed to work on folders''')
+            return hash_directory(filepath, hash_format=hash_format)
         # if file itself doesnt exist
         if not os.path.exists(filepath):
             return super_hash((file_doesnt_exist_key, filepath))
-        hash_value = file_exists_key
-        # read bytes in chunks to create a hash
         with open(filepath, "rb") as file:
-            block = file.read(_block_read_size)
-            while block != b"":
-                # block chain
-                hash_value = consistent_hash(bytes(hash_value, "utf-8")+block)
-                block = file.read(_block_read_size)
-        return hash_value
+            if hash_format == "chained":
+                return _chained_file_hash(file, _block_read_size)
+            return _streamed_file_hash(file)
     
     if file:
-        hash_value = file_exists_key
-        block = file.read(_block_read_size)
-        while block != b"":
-            # block chain
-            hash_value = consistent_hash(bytes(hash_value, "utf-8")+block)
-            block = file.read(_block_read_size)
-        return hash_value
+        if hash_format == "chained":
+            return _chained_file_hash(file, _block_read_size)
+        return _streamed_file_hash(file)
     
     # if filepath was only arg and was None
     return super_hash(None)
@@ -79,11 +247,57 @@ class helpers:
         source = inspect.getsource(value)
         return consistent_hash(f"{hash_salt}{source}")
     
+# 
+# source file recording (lets callers know which files a function hash depends on)
+# 
+import threading
+_source_file_recorders = threading.local()
+
+class record_source_files:
+    """
+    with record_source_files() as source_files:
+        super_hash(some_function)
+    # source_files is a set of the filenames of every function that was part of the hash
+    """
+    def __enter__(self):
+        self.source_files = set()
+        if not hasattr(_source_file_recorders, "stack"):
+            _source_file_recorders.stack = []
+        _source_file_recorders.stack.append(self.source_files)
+        return self.source_files
+    
+    def __exit__(self, *args):
+        _source_file_recorders.stack.remove(self.source_files)
+
+def _note_source_file(value):
+    stack = getattr(_source_file_recorders, "stack", None)
+    if stack:
+        value_code = value if type(value) == code else getattr(value, "__code__", None)
+        if value_code is not None:
+            for each in stack:
+                each.add(value_code.co_filename)
+
+def _note_source_filenames(filenames):
+    stack = getattr(_source_file_recorders, "stack", None)
+    if stack:
+        for each in stack:
+            each.update(filenames)
+
+# (module, name, value) of every module global function_hashers.deep looked up, see memoized_function_hash
+_global_recorders = threading.local()
+
+def _note_global(module, name, value):
+    stack = getattr(_global_recorders, "stack", None)
+    if stack and module is not None:
+        for each in stack:
+            each.append((vars(module), name, value))
+
 class function_hashers:
     @staticmethod
     def smart(value, debug=False, already_seen=None):
         if not already_seen:
             already_seen = set()
+        _note_source_file(value)
         # for recursive functions (this is an imperfect fix for multiple-recusion functions)
         if id(value) in already_seen:
             return function_hashers.shallow(value)
@@ -159,6 +373,7 @@ class function_hashers:
                 closed_set.append(function_name)
                 
             function_reference = getattr(module, function_name, None)
+            _note_global(module, function_name, function_reference)
             if function_reference is None:
                 continue
             try:
@@ -166,6 +381,7 @@ class function_hashers:
             except TypeError as error:
                 continue
             
+            _note_source_file(function_reference)
             instruction_hashes.append(
                 super_hash(tuple(function_hashers.instructions_to_hash((each,),already_seen=already_seen) for each in instructions))
             )
@@ -214,18 +430,692 @@ class FrozenDict(mapping):
             self._hash = hash_
         return self._hash
 
+from collections import OrderedDict
+class ConversionTable(OrderedDict):
+    """
+    An OrderedDict that throws away super_hash's per-type dispatch cache whenever it changes
+    """
+    def _changed(self):
+        super_hash._dispatch_cache.clear()
+    
+    def __setitem__(self, key, value):
+        OrderedDict.__setitem__(self, key, value)
+        self._changed()
+    
+    def __delitem__(self, key):
+        OrderedDict.__delitem__(self, key)
+        self._changed()
+    
+    def clear(self):
+        OrderedDict.clear(self)
+        self._changed()
+    
+    def pop(self, *args):
+        output = OrderedDict.pop(self, *args)
+        self._changed()
+        return output
+    
+    def popitem(self, *args, **kwargs):
+        output = OrderedDict.popitem(self, *args, **kwargs)
+        self._changed()
+        return output
+    
+    def setdefault(self, key, default=None):
+        output = OrderedDict.setdefault(self, key, default)
+        self._changed()
+        return output
+    
+    def update(self, *args, **kwargs):
+        OrderedDict.update(self, *args, **kwargs)
+        self._changed()
+    
+    def move_to_end(self, *args, **kwargs):
+        OrderedDict.move_to_end(self, *args, **kwargs)
+        self._changed()
+
+def _resolve_dispatch(value, conversion_table):
+    """
+    Returns the conversion_table entries that could still apply to values with the same type as `value`, in priority order.
+    Each item is (predicate_or_None, custom_hash_function), a None predicate means it always matches.
+    Type patterns and predicates marked with `depends_only_on_type = True` are decided here, once per type,
+    every other predicate has to be checked against each value.
+    """
+    value_type = type(value)
+    plan = []
+    for pattern in reversed(conversion_table.keys()):
+        if isinstance(pattern, type):
+            if issubclass(value_type, pattern):
+                plan.append((None, conversion_table[pattern]))
+                break
+        elif callable(pattern):
+            if getattr(pattern, "depends_only_on_type", False):
+                if pattern(value):
+                    plan.append((None, conversion_table[pattern]))
+                    break
+            else:
+                plan.append((pattern, conversion_table[pattern]))
+    return tuple(plan)
+
+def _find_custom_hash_function(value):
+    """
+    Returns the conversion_table function that should hash `value`, or None
+    """
+    conversion_table = super_hash.conversion_table
+    if isinstance(conversion_table, ConversionTable):
+        value_type = type(value)
+        plan = super_hash._dispatch_cache.get(value_type, None)
+        if plan is None:
+            plan = _resolve_dispatch(value, conversion_table)
+            if len(super_hash._dispatch_cache) > 10000:
+                super_hash._dispatch_cache.clear()  # don't keep dynamically created classes alive forever
+            super_hash._dispatch_cache[value_type] = plan
+        for predicate, custom_hash_function in plan:
+            if predicate is None or predicate(value):
+                return custom_hash_function
+    else:
+        # someone replaced the table with a plain dict, so changes to it can't be tracked
+        for pattern in reversed(conversion_table.keys()):
+            type_matches = isinstance(pattern, type) and isinstance(value, pattern)
+            callable_check_matches = not isinstance(pattern, type) and callable(pattern) and pattern(value)
+            if type_matches or callable_check_matches:
+                return conversion_table[pattern]
+    return None
+
+# 
+# streaming encoder
+# 
+import struct
+import itertools
+import operator
+_pack_length = struct.Struct("<Q").pack
+_pack_float = struct.Struct("<d").pack
+_end_of_container = object()
+_streamable_containers = (list, tuple, dict, set, frozenset)
+
+def _class_tag(value):
+    value_class = value.__class__
+    return f"{getattr(value_class, '__module__', '')}.{getattr(value_class, '__qualname__', value_class.__name__)}".encode('utf-8')
+
+# dicts/sets that can only be sorted by item hash and are nested deeper than this are walked in iteration order
+# (hashing each item recurses, which could hit the recursion limit)
+_max_canonical_depth = 100
+
+_sortable_types = { str, int, bytes }
+_first = operator.itemgetter(0)
+
+def _is_unordered_type(value_type):
+    # dict subclasses (ex: OrderedDict) can care about order, so only plain dicts are treated as unordered
+    return value_type is dict or issubclass(value_type, (set, frozenset))
+
+# (opcode, what follows it) for EMPTY_DICT and EMPTY_SET followed by MEMOIZE and a MARK (meaning they have items to add),
+# and FROZENSET followed by MEMOIZE. A dict with one item, or an empty dict/set, already pickles the same way every time
+_unordered_opcodes = ((b"}", b"\x94("), (b"\x8f", b"\x94("), (b"\x91", b"\x94"))
+# after this many of an opcode's byte show up in data, stop looking and let _canonical_form decide
+_max_opcode_false_positives = 64
+
+def _has_unordered_opcodes(pickled):
+    """
+    False if `pickled` (protocol 4) definitely has no dict/set/frozenset with more than one item
+    """
+    # bytes.find() of a single byte is a memchr, searching for the whole sequence is much slower
+    find = pickled.find
+    startswith = pickled.startswith
+    for opcode, suffix in _unordered_opcodes:
+        position = find(opcode)
+        false_positives = 0
+        while position != -1:
+            if startswith(suffix, position + 1):
+                return True
+            false_positives += 1
+            if false_positives > _max_opcode_false_positives:
+                return True
+            position = find(opcode, position + 1)
+    return False
+
+class _Sorted:
+    """
+    Stands in for a dict/set/frozenset in _canonical_form, so it pickles as its sorted items (and can't be confused with a list/tuple)
+    """
+    __slots__ = ("kind", "items")
+    def __init__(self, kind, items):
+        self.kind = kind
+        self.items = items
+    
+    def __reduce__(self):
+        return (_Sorted, (self.kind, self.items))
+
+def _canonical_form(value, depth=0):
+    """
+    Returns a copy of the list/tuple/dict/set/frozenset `value` where every dict, set and frozenset inside of it is a _Sorted
+    (parts without any are reused as-is, `value` itself is returned if there aren't any).
+    Returns NotImplemented when that's not possible (keys of different types, subclasses of list/dict/etc with a dict/set inside,
+    very deep nesting or a cycle) and stream_hash needs to be used instead.
+    """
+    if depth > _max_canonical_depth:
+        return NotImplemented
+    value_type = type(value)
+    if value_type is dict or value_type is set or value_type is frozenset:
+        key_types = set(map(type, value))
+        if len(key_types) > 1 or not key_types.issubset(_sortable_types):
+            return NotImplemented
+        if value_type is not dict:
+            return _Sorted(value_type.__name__, tuple(sorted(value)))
+        items = []
+        for each_key, each_value in sorted(value.items(), key=_first):
+            if isinstance(each_value, _streamable_containers):
+                each_value = _canonical_form(each_value, depth + 1)
+                if each_value is NotImplemented:
+                    return NotImplemented
+            items.append((each_key, each_value))
+        return _Sorted("dict", tuple(items))
+    
+    # list, tuple, or a subclass of one of the containers
+    if isinstance(value, (set, frozenset)):
+        return NotImplemented
+    if isinstance(value, dict):
+        children = itertools.chain.from_iterable(value.items())
+    else:
+        # (C code) lists of primitives are the common case, they don't need to be looked at one at a time
+        if not any(issubclass(each, _streamable_containers) for each in set(map(type, value))):
+            return value
+        children = value
+    changed = False
+    items = []
+    for each in children:
+        if isinstance(each, _streamable_containers):
+            canonical = _canonical_form(each, depth + 1)
+            if canonical is NotImplemented:
+                return NotImplemented
+            changed = changed or canonical is not each
+            each = canonical
+        items.append(each)
+    if not changed:
+        return value
+    if value_type is list:
+        return items
+    if value_type is tuple:
+        return tuple(items)
+    # the subclass might not be rebuildable from its items
+    return NotImplemented
+
+def _item_digest(item, already_seen):
+    hasher = new_hasher()
+    stream_hash(item, hasher, already_seen, walk_root=False)
+    return hasher.digest()
+
+def stream_hash(value, hasher, already_seen, items=None, walk_root=True):
+    """
+    Feeds a canonical encoding of `value` into `hasher` (anything with an .update(bytes) method) in one pass.
+    Primitives are encoded directly, nested containers are fed as their pickle bytes when they can be pickled
+    (and have no dict/set inside) and otherwise walked with an explicit stack (so deep nesting can't hit the recursion limit),
+    anything else contributes its super_hash.
+    Dicts, sets and frozensets are encoded in sorted order (of their keys/items when those are all str, all int or all bytes,
+    otherwise of each item's hash), so neither insertion order nor PYTHONHASHSEED
+    (which changes the iteration order of sets of strings in every process) changes the hash.
+    `already_seen` holds the containers currently being walked (the path from the root), a container that contains
+    itself is encoded as a back-reference to its depth, which is how cycles are handled.
+    `value` itself is always walked (callers use this after pickle failed), unless walk_root=False.
+    `items` encodes `value` as a generic iterable with those items (for iterables that aren't lists/dicts/etc).
+    """
+    update = hasher.update
+    if items is None:
+        stack = [ iter((value,)) ]
+        stack_ids = [ None ]
+    else:
+        already_seen[id(value)] = len(already_seen)
+        class_tag = _class_tag(value)
+        update(b"I" + _pack_length(len(class_tag)) + class_tag)
+        stack = [ iter(items) ]
+        stack_ids = [ id(value) ]
+    try:
+        while stack:
+            each = next(stack[-1], _end_of_container)
+            if each is _end_of_container:
+                stack.pop()
+                finished_id = stack_ids.pop()
+                if finished_id is not None:
+                    del already_seen[finished_id]
+                update(b")")
+                continue
+            
+            each_type = type(each)
+            if each is None:
+                update(b"N")
+            elif each_type is bool:
+                update(b"T" if each else b"F")
+            elif each_type is int:
+                as_bytes = each.to_bytes((each.bit_length() + 8) // 8, "little", signed=True)
+                update(b"i" + _pack_length(len(as_bytes)) + as_bytes)
+            elif each_type is float:
+                update(b"f" + _pack_float(each))
+            elif each_type is str:
+                as_bytes = each.encode('utf-8', 'surrogatepass')
+                update(b"s" + _pack_length(len(as_bytes)) + as_bytes)
+            elif each_type is bytes:
+                update(b"b" + _pack_length(len(each)) + each)
+            elif isinstance(each, _streamable_containers) and _find_custom_hash_function(each) is None and not callable(getattr(each, "__super_hash__", None)):
+                each_id = id(each)
+                if each_id in already_seen:
+                    update(b"R" + _pack_length(already_seen[each_id]))
+                    continue
+                # pickle (which is C code) is much faster than walking this in python,
+                # so only walk the containers it can't handle (or that have a dict/set inside)
+                if (each is not value or not walk_root) and not _is_unordered_type(type(each)):
+                    try:
+                        pickled = pickle.dumps(each, protocol=4)
+                    except Exception as error:
+                        pickled = None
+                    if pickled is not None and not (_has_unordered_opcodes(pickled) and _canonical_form(each) is not each):
+                        update(b"p" + _pack_length(len(pickled)))
+                        update(pickled)
+                        continue
+                class_tag = _class_tag(each)
+                if _is_unordered_type(type(each)):
+                    # sets of strings (or ints or bytes) and dicts with keys like that can simply be sorted
+                    key_types = set(map(type, each))
+                    if len(key_types) == 1 and key_types.issubset(_sortable_types):
+                        if isinstance(each, dict):
+                            already_seen[each_id] = len(already_seen)
+                            update(b"D" + _pack_length(len(class_tag)) + class_tag + _pack_length(len(each)))
+                            stack.append(itertools.chain.from_iterable(sorted(each.items(), key=_first)))
+                            stack_ids.append(each_id)
+                        else:
+                            pickled = pickle.dumps(sorted(each), protocol=4)
+                            update(b"S" + _pack_length(len(class_tag)) + class_tag + _pack_length(len(pickled)))
+                            update(pickled)
+                        continue
+                    # otherwise sort them by the hash of each item
+                    if len(already_seen) < _max_canonical_depth:
+                        already_seen[each_id] = len(already_seen)
+                        try:
+                            item_digests = sorted(_item_digest(each_item, already_seen) for each_item in (each.items() if isinstance(each, dict) else each))
+                        finally:
+                            del already_seen[each_id]
+                        update(b"{" + _pack_length(len(class_tag)) + class_tag + _pack_length(len(item_digests)))
+                        for each_digest in item_digests:
+                            update(_pack_length(len(each_digest)) + each_digest)
+                        update(b"}")
+                        continue
+                already_seen[each_id] = len(already_seen)
+                update(b"(" + _pack_length(len(class_tag)) + class_tag + _pack_length(len(each)))
+                if isinstance(each, dict):
+                    stack.append(itertools.chain.from_iterable(each.items()))
+                else:
+                    stack.append(iter(each))
+                stack_ids.append(each_id)
+            else:
+                child_hash = str(super_hash(each, __already_seen__=already_seen)).encode('utf-8')
+                update(b"h" + _pack_length(len(child_hash)) + child_hash)
+    finally:
+        # leave already_seen the way it was found (even if hashing failed part way through)
+        for each_id in stack_ids:
+            if each_id is not None:
+                already_seen.pop(each_id, None)
+    return hasher
+
+# 
+# buffer protocol (numpy arrays, bytearray, memoryview, array.array, ...)
+# 
+# types that definitely don't support the buffer protocol (or are handled elsewhere), so there's no need to try
+_non_buffer_types = { str, int, float, bool, type(None), list, tuple, dict, set, frozenset, bytes }
+_buffer_chunk_size = 1 << 20
+
+def buffer_hash(value):
+    """
+    Hashes anything that supports the buffer protocol straight from its memory (no pickle, no copy when contiguous).
+    The header (class, format, itemsize, shape, and dtype for numpy) is hashed first, so differently shaped/typed
+    buffers never collide. Data is hashed in logical C order, so the memory layout (strides) doesn't change the hash.
+    Returns None if value doesn't support the buffer protocol.
+    """
+    value_type = type(value)
+    if value_type in _non_buffer_types:
+        return None
+    try:
+        view = memoryview(value)
+    except TypeError as error:
+        # support for the buffer protocol is a property of the type
+        _non_buffer_types.add(value_type)
+        return None
+    except Exception as error:
+        # e.g. numpy object or datetime arrays, which can't be exposed as a buffer
+        return None
+    
+    with view:
+        dtype = getattr(value, "dtype", None)
+        header = repr((_class_tag(value), view.format, view.itemsize, view.shape, getattr(dtype, "str", None)))
+        hasher = new_hasher(b"buffer" + header.encode('utf-8'))
+        if view.nbytes == 0:
+            pass
+        elif view.c_contiguous:
+            hasher.update(view.cast("B") if view.ndim != 1 or view.format != "B" else view)
+        elif dtype is not None and hasattr(value, "__array__"):
+            # numpy: walk the strided array in C order, copying at most one chunk at a time
+            import numpy
+            for chunk in numpy.nditer(value, flags=["external_loop", "buffered", "zerosize_ok", "refs_ok"], order="C", buffersize=max(1, _buffer_chunk_size // max(view.itemsize, 1))):
+                hasher.update(numpy.ascontiguousarray(chunk).view(numpy.uint8))
+        else:
+            hasher.update(view.tobytes())
+    return hasher.hexdigest()
+
+_sample_block_size = 4096
+
+def _sample_ranges(size, itemsize, sample_bytes):
+    # (start, stop) element ranges: a head, a tail, and evenly spaced blocks in between
+    budget = max(1, sample_bytes // itemsize)
+    head = tail = budget // 4
+    block = max(1, _sample_block_size // itemsize)
+    block_count = max(1, (budget - head - tail) // block)
+    middle_start, middle_stop = head, size - tail
+    step = max(block, (middle_stop - middle_start) // block_count)
+    ranges = [ (0, head) ]
+    for start in range(middle_start, middle_stop, step)[:block_count]:
+        ranges.append((start, min(start + block, middle_stop)))
+    ranges.append((size - tail, size))
+    return ranges
+
+def sampled_buffer_hash(value, sample_bytes=1 << 20):
+    """
+    WARNING: this hash is NOT exact. Only the header (class, format, shape, dtype) and about `sample_bytes` of data
+    (the head, the tail, and evenly spaced blocks in between) are hashed, so two buffers that only differ
+    outside of the sample get the same hash. Only use it for data that is never modified in place (ex: read-only
+    memory-mapped datasets identified by their path).
+    Buffers no bigger than `sample_bytes` are hashed fully (see buffer_hash). Returns None if value doesn't support the buffer protocol.
+    """
+    try:
+        view = memoryview(value)
+    except Exception as error:
+        return None
+    
+    with view:
+        if view.nbytes <= sample_bytes:
+            return buffer_hash(value)
+        dtype = getattr(value, "dtype", None)
+        header = repr((_class_tag(value), view.format, view.itemsize, view.shape, getattr(dtype, "str", None), sample_bytes))
+        hasher = new_hasher(b"sampled" + header.encode('utf-8'))
+        itemsize = view.itemsize
+        size = view.nbytes // itemsize
+        if view.c_contiguous:
+            data = view.cast("B") if view.ndim != 1 or view.format != "B" else view
+            for start, stop in _sample_ranges(size, itemsize, sample_bytes):
+                hasher.update(data[start*itemsize:stop*itemsize])
+        elif dtype is not None and hasattr(value, "flat"):
+            # numpy: .flat slices follow the logical C order, so the layout doesn't change the hash
+            import numpy
+            for start, stop in _sample_ranges(size, itemsize, sample_bytes):
+                hasher.update(numpy.ascontiguousarray(value.flat[start:stop]).view(numpy.uint8))
+        else:
+            data = view.tobytes()
+            for start, stop in _sample_ranges(size, itemsize, sample_bytes):
+                hasher.update(data[start*itemsize:stop*itemsize])
+    return hasher.hexdigest()
+
+# 
+# identity memo: objects that promise not to change (or to report a new version when they do) are hashed once
+# 
+import weakref
+
+class IdentityMemo:
+    """
+    Maps objects, by identity (not by ==), to values without leaking them or confusing them with a later object that got the same id
+        objects that support weakrefs: dropped from the memo when they're garbage collected
+        everything else: kept alive (so their id can't be reused) in an LRU of at most max_strong_entries, oldest are evicted
+    """
+    def __init__(self, max_strong_entries=1024):
+        self.max_strong_entries = max_strong_entries
+        self.weak = {}                           # id -> (weakref, value)
+        self.strong = collections.OrderedDict()  # id -> (object, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key, default=None):
+        key_id = id(key)
+        entry = self.weak.get(key_id)
+        if entry is not None and entry[0]() is key:
+            self.hits += 1
+            return entry[1]
+        entry = self.strong.get(key_id)
+        if entry is not None and entry[0] is key:
+            with self.lock:
+                if key_id in self.strong:
+                    self.strong.move_to_end(key_id)
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        return default
+    
+    def set(self, key, value):
+        key_id = id(key)
+        try:
+            reference = weakref.ref(key, lambda reference: self._forget(key_id, reference))
+        except TypeError as error:
+            reference = None
+        with self.lock:
+            if reference is not None:
+                self.strong.pop(key_id, None)
+                self.weak[key_id] = (reference, value)
+                return
+            if self.max_strong_entries <= 0:
+                return
+            self.weak.pop(key_id, None)
+            self.strong[key_id] = (key, value)
+            self.strong.move_to_end(key_id)
+            while len(self.strong) > self.max_strong_entries:
+                self.strong.popitem(last=False)
+                self.evictions += 1
+    
+    def _forget(self, key_id, reference):
+        with self.lock:
+            entry = self.weak.get(key_id)
+            if entry is not None and entry[0] is reference:
+                del self.weak[key_id]
+    
+    def clear(self):
+        with self.lock:
+            self.weak.clear()
+            self.strong.clear()
+    
+    def __len__(self):
+        return len(self.weak) + len(self.strong)
+    
+    def info(self):
+        return dict(
+            size=len(self),
+            weak_entries=len(self.weak),
+            strong_entries=len(self.strong),
+            max_strong_entries=self.max_strong_entries,
+            hits=self.hits,
+            misses=self.misses,
+            evictions=self.evictions,
+        )
+
+# value -> (version, hash algorithm, hash), only types that support weakrefs get memoized here (see _memo_kind)
+_identity_memo = IdentityMemo(max_strong_entries=0)
+_memo_kinds = {}      # type -> None, "frozen" or "versioned"
+
+class FrozenTypes(set):
+    """
+    A set that throws away the per-type memo decisions whenever it changes
+    """
+    def add(self, value_type):
+        set.add(self, value_type)
+        _memo_kinds.clear()
+    
+    def update(self, *args):
+        set.update(self, *args)
+        _memo_kinds.clear()
+    
+    def discard(self, value_type):
+        set.discard(self, value_type)
+        _memo_kinds.clear()
+    
+    def remove(self, value_type):
+        set.remove(self, value_type)
+        _memo_kinds.clear()
+    
+    def clear(self):
+        set.clear(self)
+        _memo_kinds.clear()
+
+# classes whose instances never change, for classes that can't be given a __super_hash_frozen__ = True attribute
+frozen_types = FrozenTypes()
+
+def _memo_kind(value_type):
+    memo_kind = _memo_kinds.get(value_type, NotImplemented)
+    if memo_kind is NotImplemented:
+        if getattr(value_type, "__super_hash_version__", None) is not None:
+            memo_kind = "versioned"
+        elif value_type in frozen_types or getattr(value_type, "__super_hash_frozen__", False) is True:
+            memo_kind = "frozen"
+        else:
+            memo_kind = None
+        if getattr(value_type, "__weakrefoffset__", 1) == 0:
+            # without weakrefs the id could be reused by a different object after this one is deleted
+            memo_kind = None
+        _memo_kinds[value_type] = memo_kind
+    return memo_kind
+
+def is_memoizable(value):
+    """
+    True if super_hash(value) is only computed once per object (and per version), which is the case for
+        instances of classes with __super_hash_frozen__ = True (a promise that instances are never mutated)
+        instances of classes in super_hash.frozen_types
+        objects with a __super_hash_version__ (an attribute, or a method) that changes every time the object is mutated
+    The object must support weakrefs (the memo entry is dropped when the object is garbage collected)
+    """
+    return _memo_kind(type(value)) is not None
+
+def _memoized_super_hash(value, memo_kind):
+    version = None
+    if memo_kind == "versioned":
+        version = value.__super_hash_version__
+        if callable(version):
+            version = version()
+    entry = _identity_memo.get(value)
+    if entry is not None and entry[0] == version and entry[1] == _hash_algorithm_tag:
+        return entry[2]
+    # hashed on its own (not with the caller's already_seen) so the result doesn't depend on where the object was found
+    output = _super_hash(value, {})
+    _identity_memo.set(value, (version, _hash_algorithm_tag, output))
+    return output
+
+# function -> (code, closure contents, defaults, kwdefaults, hash algorithm, module globals it used, source files, hash)
+# closure contents and globals are held as _references, so an entry doesn't keep its own function alive
+# (a recursive function's closure cell, or the module global it calls itself through, is the function)
+_function_memo = IdentityMemo(max_strong_entries=0)
+_missing = object()
+
+class _StrongReference:
+    """Same interface as a weakref.ref, for objects that don't support weak references (ints, tuples, lists, etc)"""
+    __slots__ = ("value",)
+    def __init__(self, value):
+        self.value = value
+    
+    def __call__(self):
+        return self.value
+
+def _reference(value):
+    try:
+        return weakref.ref(value)
+    except TypeError as error:
+        return _StrongReference(value)
+
+def _closure_contents(function):
+    output = []
+    for each_cell in function.__closure__ or ():
+        try:
+            output.append(each_cell.cell_contents)
+        except ValueError as error:
+            # empty cell
+            output.append(_missing)
+    return tuple(output)
+
+def _refers_to(reference, value):
+    referent = reference()
+    # (a dead weakref returns None, which isn't the None that might be there now)
+    return referent is value and (referent is not None or type(reference) is _StrongReference)
+
+def _code_of(value):
+    # a global function can have its __code__ reassigned without the global itself changing
+    return getattr(getattr(value, "__func__", value), "__code__", None)
+
+def _same_global(module_globals, name, global_reference, global_code):
+    value = module_globals.get(name, None)
+    return _refers_to(global_reference, value) and _code_of(value) is global_code
+
+def _same_objects(references, values):
+    return len(references) == len(values) and all(_refers_to(each_reference, each_value) for each_reference, each_value in zip(references, values))
+
+def memoized_function_hash(value):
+    """
+    function_hashers.smart, but only recomputed when something it depends on changes:
+        the function's __code__ (including reassigning it), its closure contents, its defaults,
+        the hash algorithm, or any module global the deep hash looked up (ex: a helper function being redefined, or its __code__ reassigned)
+    Functions and methods share the memo entry of their underlying function, other callables aren't memoized.
+    """
+    function = getattr(value, "__func__", value)
+    function_code = getattr(function, "__code__", None)
+    if type(function_code) != code:
+        return function_hashers.smart(value)
+    closure_contents = _closure_contents(function)
+    entry = _function_memo.get(function)
+    if (
+        entry is not None
+        and entry[0] is function_code
+        and _same_objects(entry[1], closure_contents)
+        and entry[2] is function.__defaults__
+        and entry[3] is function.__kwdefaults__
+        and entry[4] == _hash_algorithm_tag
+        and all(_same_global(*each_global) for each_global in entry[5])
+    ):
+        _note_source_filenames(entry[6])
+        return entry[7]
+    
+    if not hasattr(_global_recorders, "stack"):
+        _global_recorders.stack = []
+    used_globals = []
+    _global_recorders.stack.append(used_globals)
+    try:
+        with record_source_files() as source_files:
+            output = function_hashers.smart(function)
+    finally:
+        _global_recorders.stack.remove(used_globals)
+    _note_source_filenames(source_files)
+    closure_references = tuple(_reference(each) for each in closure_contents)
+    global_references = tuple((module_globals, name, _reference(global_value), _code_of(global_value)) for module_globals, name, global_value in used_globals)
+    _function_memo.set(function, (function_code, closure_references, function.__defaults__, function.__kwdefaults__, _hash_algorithm_tag, global_references, frozenset(source_files), output))
+    return output
+
+def memo_info():
+    """
+    Sizes and hit/miss counts of super_hash's internal memos
+        "non_iterable": hashes of functions/builtins/etc (super_hash._non_iterable_cache)
+        "identity": hashes of frozen/versioned objects (see is_memoizable)
+        "function": hashes of functions/methods (see memoized_function_hash)
+    """
+    return dict(
+        non_iterable=super_hash._non_iterable_cache.info(),
+        identity=_identity_memo.info(),
+        function=_function_memo.info(),
+    )
+
 # lots of things are not hashable when they could be (dicts), we need to make them hashable
 def super_hash(value, *, __already_seen__=None):
-    already_seen = {} if __already_seen__ is None else __already_seen__
+    memo_kind = _memo_kinds.get(type(value), NotImplemented)
+    if memo_kind is NotImplemented:
+        memo_kind = _memo_kind(type(value))
+    if memo_kind is not None:
+        return _memoized_super_hash(value, memo_kind)
+    return _super_hash(value, {} if __already_seen__ is None else __already_seen__)
+
+def _super_hash(value, already_seen):
     # 
     # first check the table
     # 
-    for pattern in reversed(super_hash.conversion_table.keys()):
-        type_matches = isinstance(pattern, type) and isinstance(value, pattern)
-        callable_check_matches = not isinstance(pattern, type) and callable(pattern) and pattern(value)
-        if type_matches or callable_check_matches:
-            custom_hash_function = super_hash.conversion_table[pattern]
-            return custom_hash_function(value)
+    custom_hash_function = _find_custom_hash_function(value)
+    if custom_hash_function is not None:
+        return custom_hash_function(value)
     
     super_hash_method = getattr(value, "__super_hash__", None)
     if callable(super_hash_method):
@@ -236,6 +1126,11 @@ def super_hash(value, *, __already_seen__=None):
             return shallow_instruction_hash(value)
         except Exception as error:
             return consistent_hash(code.co_code)
+    
+    # numpy arrays, bytearrays, etc: hash their memory directly instead of pickling a copy of it
+    output = buffer_hash(value)
+    if output is not None:
+        return output
     # 
     # fallback 1: attempt consistent hash
     # 
@@ -248,45 +1143,21 @@ def super_hash(value, *, __already_seen__=None):
     # generic fallback methods
     # 
     value_id = id(value)
-    if helpers.is_iterable(value):
+    # lists/dicts/sets/tuples that pickle couldn't handle (e.g. they contain a lambda)
+    if isinstance(value, _streamable_containers):
+        return stream_hash(value, new_hasher(), already_seen).hexdigest()
+    elif helpers.is_iterable(value):
+        # some other kind of iterable, hash it like a list of its items
         if value_id in already_seen:
-            # seen but not yet computed
-            if already_seen[value_id] is None:
-                # FIXME: this is a problem when dealing with sets or lists, as two already-seen items in two different orders will result in the same parent hash
-                #        however this problem is equivlent (technially "bijective") to the problem of hashing an unlabelled graph
-                #        at the theory level, there is no proven method for hashing an unlabelled graph, although there are some not-proven-incorrect methods
-                return hash_salt # hash of something that is pending
-            else:
-                return already_seen[value_id]
-        else:
-            already_seen[value_id] = None
-        
-        # dict is a special case, switch to using all its keys
-        if isinstance(value, dict):
-            value = (
-                (
-                    super_hash(each_key, __already_seen__=already_seen),
-                    super_hash(each_value, __already_seen__=already_seen),
-                    super_hash(value.__class__),
-                ) 
-                    for each_key, each_value in value.items() 
-            )
-        # all the items
-        output = super_hash(
-            tuple(
-                super_hash(each, __already_seen__=already_seen) for each in value
-            ) + (
-                super_hash(value.__class__),
-            )
-        )
-        # give it a real value
-        already_seen[value_id] = output
-        return already_seen[value_id]
+            return consistent_hash(f"{hash_salt}{already_seen[value_id]}")
+        return stream_hash(value, new_hasher(), already_seen, items=value).hexdigest()
     # some weird primitive, like a class or method or builtin function
     else:
         # if cached
-        if value_id in super_hash._non_iterable_cache:
-            return super_hash._non_iterable_cache[value_id]
+        non_iterable_cache = super_hash._non_iterable_cache
+        output = non_iterable_cache.get(value, NotImplemented)
+        if output is not NotImplemented:
+            return output
         
         # if its a type
         if isinstance(value, type):
@@ -299,31 +1170,40 @@ def super_hash(value, *, __already_seen__=None):
         
         # if statically defined in a file
         try:
-            super_hash._non_iterable_cache[value_id] = helpers.source_hash(value)
-            return super_hash._non_iterable_cache[value_id]
+            output = helpers.source_hash(value)
+            non_iterable_cache.set(value, output)
+            return output
         except Exception as error:
             pass
         
         # if dynamically defined
         try:
-            super_hash._non_iterable_cache[value_id] = shallow_instruction_hash(value)
-            return super_hash._non_iterable_cache[value_id]
+            output = shallow_instruction_hash(value)
+            non_iterable_cache.set(value, output)
+            return output
         except Exception as error:
             pass
         
         # if has documentation (e.g. builtin)
         if type(value.__doc__) == str and len(value.__doc__) > 0 and type(value).__name__ == str:
-            super_hash._non_iterable_cache[value_id] = consistent_hash(f'{hash_salt}{value.__doc__}{value.__name__}')
-            return super_hash._non_iterable_cache[value_id]
+            output = consistent_hash(f'{hash_salt}{value.__doc__}{value.__name__}')
+            non_iterable_cache.set(value, output)
+            return output
         
         # if all this fails, use the object id
-        super_hash._non_iterable_cache[value_id] = value_id
-        return super_hash._non_iterable_cache[value_id]
+        non_iterable_cache.set(value, value_id)
+        return value_id
 
-from collections import OrderedDict
-super_hash._non_iterable_cache = {}
-super_hash.conversion_table = OrderedDict()
+def is_function_like(each):
+    return callable(each) and not isinstance(each, type)
+# callable() and isinstance(each, type) only look at the type of `each`
+is_function_like.depends_only_on_type = True
+
+# id()-safe: entries die with their object (or are LRU-evicted if it can't be weakref-ed), see memo_info()
+super_hash._non_iterable_cache = IdentityMemo(max_strong_entries=1024)
+super_hash._dispatch_cache = {}
+super_hash.conversion_table = ConversionTable()
 super_hash.conversion_table[
     # have functions default to deep hashing
-    (lambda each: callable(each) and not isinstance(each, type))
-] = function_hashers.smart
\ No newline at end of file
+    is_function_like
+] = memoized_function_hash
\ No newline at end of file
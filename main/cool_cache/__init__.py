@@ -3,15 +3,26 @@
 # has been modified to use super_hash and work on python3.8
 
 from os import path
+import os
+import sys
+import stat
+import marshal
+import atexit
+import queue
 import time
+import heapq
+import itertools
+import operator
 import threading
+import warnings
+import weakref
+from time import perf_counter
 
 from .__dependencies__ import file_system_py as FS
-from .__dependencies__.super_hash import super_hash, hash_file
+from .__dependencies__.super_hash import super_hash, hash_file, hash_directory, set_hash_algorithm, get_hash_algorithm, buffer_hash, sampled_buffer_hash, is_memoizable, record_source_files
 
 # TODO:
     # create a class based system as an alternaitve to global settings
-    # perform lightweight checks on list-likes (numpy, torch tensors, etc), by saving their shape and comparing shape before fully hashing what might be a giantic object (if shapes are different cache is instantly busted)
 
 def get_pickle():
     pickle = None
@@ -35,16 +46,64 @@ class NotGiven:
 class _CacheEntry:
     # sentinel wrapper so (created_at, value) can never be confused
     # with a user value that happens to be a 2-tuple starting with a float
-    __slots__ = ("created_at", "value")
-    def __init__(self, created_at, value):
+    # compute_seconds/value_bytes/frequency feed the gdsf eviction policy (None = unknown)
+    __slots__ = ("created_at", "value", "compute_seconds", "value_bytes", "frequency")
+    def __init__(self, created_at, value, compute_seconds=None, value_bytes=None):
         self.created_at = created_at
         self.value = value
+        self.compute_seconds = compute_seconds
+        self.value_bytes = value_bytes
+        self.frequency = 1
+
+    def __getstate__(self):
+        return { each: getattr(self, each) for each in _CacheEntry.__slots__ }
+
+    def __setstate__(self, state):
+        # default pickling of a __slots__ class gives (None, slot_dict); older cache files
+        # only have created_at and value, so fill in the rest
+        if isinstance(state, tuple):
+            state = state[1]
+        self.compute_seconds = None
+        self.value_bytes = None
+        self.frequency = 1
+        for key, value in state.items():
+            setattr(self, key, value)
 
 settings = Object()
 settings.default_folder = "cache.ignore/"
 settings.worker_que_size = 1000
+# number of background writer threads; each cache file always goes to the same thread
+settings.writer_threads = 1
 settings.prefer_dill_over_pickle = True
 settings.default_keep_for = None
+# "md5", "blake2b", "blake2s" or "xxhash" (needs `pip install xxhash`), used for every argument/function/file hash
+# hash_digest_size only applies to blake2b/blake2s (default 16 bytes)
+settings.hash_algorithm = "md5"
+settings.hash_digest_size = None
+# callables that receive a CacheEvent for every lookup/hit/miss/compute/eviction/enqueue/file_load/file_write/corruption_removal/expiry
+settings.hooks = []
+# seconds the writer waits after a miss so that bursts of misses become one file write
+settings.flush_interval = 0.5
+# max seconds spent writing pending caches when the interpreter exits (None = no limit)
+settings.exit_flush_timeout = 10
+# "stat": a watched file is only re-read when its (device, inode, size, mtime, ctime) changes
+# "strict": every watched file is fully re-read on every call
+# "inotify": (linux) a watched file isn't even stat-ed until the kernel reports a change to it, falls back to "stat" elsewhere
+settings.file_hash_mode = "stat"
+# "stream": one running digest over large reads/mmap
+# "chained": the slow per-chunk format from 0.4 and older
+settings.file_hash_format = "stream"
+# threads used to hash the paths from watch_filepaths in parallel (1 = one after another on the calling thread)
+# hashlib releases the GIL for large buffers, so size this to what the storage can serve in parallel
+settings.file_hash_workers = 1
+# reuse the (slow to compute) hash of each decorated function between processes, until one of its source files changes
+# saved as .function_digests in the cache folder
+settings.persist_function_digests = True
+# hash each decorated function (and bust=True) on its first call instead of when it's decorated,
+# so functions that are never called cost nothing at import time
+settings.lazy_function_hash = False
+# optional path of a file where the stat fingerprints are saved, so they're reused by the next process (None = per process)
+settings.file_fingerprint_file = None
 
 TIME_SUFFIXES_IN_SECONDS = {
     # ms is milliseconds to keep the shorthand compact
@@ -62,20 +121,553 @@ class PerFuncCache:
         self.calculated = False
         self.cache_file_name = ""
         self.deep_hash = ""
+        # the hash algorithm cache_file_name/deep_hash were computed with (None until bound)
+        self.hash_algorithm = None
         self.arg_hash_to_value = {}
         self.lock = threading.Lock()
+        # keys added/removed since the last write (guarded by self.lock)
+        self.dirty_keys = set()
+        # True while this manager is sitting in the worker_que (guarded by self.lock)
+        self.write_pending = False
+        # the writer thread's view of what is on disk (only touched by the writer after loading)
+        self.persisted = {}
+        self.stats = None
+        self.on_event = None
+
+class EvictionPolicy:
+    """
+    Picks which entries to drop once a cache holds more than max_entries entries or max_bytes (pickled) bytes.
+    Both policies are a min-heap of priorities, stale heap records are skipped lazily.
+        "lru":  priority = last access
+        "gdsf": GreedyDual-Size-Frequency, priority = inflation + frequency * compute_seconds / value_bytes
+                keeps the entries that are the most expensive to recompute per byte of storage
+    """
+    kinds = ("lru", "gdsf")
+
+    def __init__(self, kind, max_entries=None, max_bytes=None):
+        if kind not in EvictionPolicy.kinds:
+            raise ValueError(f"eviction must be one of {EvictionPolicy.kinds}, got {kind!r}")
+        self.kind = kind
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.heap = []
+        self.priorities = {}
+        self.sizes = {}
+        self.total_bytes = 0
+        self.inflation = 0.0
+        self.counter = itertools.count()
+
+    @property
+    def needs_value_bytes(self):
+        return self.kind == "gdsf" or self.max_bytes is not None
+
+    def priority_of(self, entry):
+        if self.kind == "lru":
+            return next(self.counter)
+        return self.inflation + entry.frequency * (entry.compute_seconds or 0.0) / max(entry.value_bytes or 1, 1)
+
+    def touch(self, key, entry):
+        # call when an entry is added or hit
+        priority = self.priority_of(entry)
+        self.priorities[key] = priority
+        heapq.heappush(self.heap, (priority, next(self.counter), key))
+        if key not in self.sizes:
+            self.sizes[key] = entry.value_bytes or 0
+            self.total_bytes += self.sizes[key]
+        # drop the stale records every once in a while so the heap can't grow with the number of hits
+        if len(self.heap) > 2 * len(self.priorities) + 64:
+            self.heap = [ each for each in self.heap if self.priorities.get(each[2], None) == each[0] ]
+            heapq.heapify(self.heap)
+
+    def discard(self, key):
+        self.priorities.pop(key, None)
+        self.total_bytes -= self.sizes.pop(key, 0)
+
+    def is_over_limit(self):
+        if self.max_entries is not None and len(self.priorities) > self.max_entries:
+            return True
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            return True
+        return False
+
+    def evict(self):
+        # returns the keys that need to be removed to get back within the limits
+        evicted = []
+        while self.heap and self.is_over_limit():
+            priority, _, key = heapq.heappop(self.heap)
+            if self.priorities.get(key, None) != priority:
+                continue  # stale record
+            if self.kind == "gdsf":
+                self.inflation = priority
+            self.discard(key)
+            evicted.append(key)
+        return evicted
+
+class CacheStats:
+    """
+    Counters and cumulative seconds-per-phase for one decorated function.
+    Compare seconds["super_hash"] + seconds["hash_file"] against seconds["input_func"]
+    to see whether caching a function is paying off.
+    """
+    phases = ("load", "arg_hash_inputs", "hash_file", "depends_on", "super_hash", "input_func", "persist")
+    # the phases that are paid on every call just to find the cache key
+    hashing_phases = ("arg_hash_inputs", "hash_file", "depends_on", "super_hash")
+
+    def __init__(self, input_func, get_size):
+        self.name = f"{getattr(input_func, '__module__', None)}.{getattr(input_func, '__qualname__', repr(input_func))}"
+        self.get_size = get_size
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.rejected = 0
+        self.evictions = 0
+        self.seconds = { each: 0.0 for each in CacheStats.phases }
+        all_cache_stats[next(_cache_stats_ids)] = self
+
+    def record(self, seconds, hits=0, misses=0, expired=0, rejected=0, evictions=0):
+        with self.lock:
+            self.hits += hits
+            self.misses += misses
+            self.expired += expired
+            self.rejected += rejected
+            self.evictions += evictions
+            for each_phase, each_duration in seconds.items():
+                self.seconds[each_phase] += each_duration
+
+    def average_hash_seconds(self):
+        with self.lock:
+            calls = self.hits + self.misses
+            if calls == 0:
+                return None
+            return sum(self.seconds[each] for each in CacheStats.hashing_phases) / calls
+
+    def info(self):
+        with self.lock:
+            return dict(
+                name=self.name,
+                hits=self.hits,
+                misses=self.misses,
+                expired=self.expired,
+                rejected=self.rejected,
+                evictions=self.evictions,
+                size=self.get_size(),
+                seconds=dict(self.seconds),
+            )
+
+class CacheEvent:
+    """
+    Passed to every hook in settings.hooks and to cache(on_event=...)
+    `seconds` is the duration of the phase the event describes (when it has one)
+    """
+    __slots__ = ("kind", "function_name", "seconds", "arg_hash", "cache_file_name", "timestamp")
+    kinds = ("lookup", "hit", "miss", "expiry", "compute", "eviction", "enqueue", "file_load", "file_write", "corruption_removal")
+
+    def __init__(self, kind, function_name, seconds=None, arg_hash=None, cache_file_name=None):
+        self.kind = kind
+        self.function_name = function_name
+        self.seconds = seconds
+        self.arg_hash = arg_hash
+        self.cache_file_name = cache_file_name
+        self.timestamp = time.time()
+
+    def __repr__(self):
+        return f"CacheEvent(kind={self.kind!r}, function_name={self.function_name!r}, seconds={self.seconds!r}, arg_hash={self.arg_hash!r}, cache_file_name={self.cache_file_name!r})"
+
+def _emit(on_event, kind, function_name, **details):
+    # callers check `on_event is not None or settings.hooks` first so an unhooked cache pays nothing
+    event = CacheEvent(kind, function_name, **details)
+    hooks = list(settings.hooks)
+    if on_event is not None:
+        hooks.append(on_event)
+    for each_hook in hooks:
+        try:
+            each_hook(event)
+        except Exception as error:
+            warnings.warn(f"cool_cache hook {each_hook} raised {error!r} for {event}")
+
+# every live CacheStats (in the order they were created), for stats(). Weak so a dropped cached function can release its cache
+all_cache_stats = weakref.WeakValueDictionary()
+_cache_stats_ids = itertools.count()
+
+def stats():
+    """
+    Returns a list of cache_info() dicts, one per decorated function
+    """
+    return [ each.info() for each in tuple(all_cache_stats.values()) ]
+
+class WriterPool:
+    """
+    One queue + daemon thread per shard. A cache file is always routed to the
+    same shard, so writes to one file stay ordered while a huge cache file
+    can't hold up the writes of every other function.
+    """
+    def __init__(self, thread_count, que_size):
+        self.ques = [ queue.Queue(maxsize=que_size) for _ in range(max(1, thread_count)) ]
+        self.threads = [ threading.Thread(target=worker, args=(each_que,), daemon=True) for each_que in self.ques ]
+        for each_thread in self.threads:
+            each_thread.start()
+
+    def que_for(self, cache_file_name):
+        return self.ques[hash(cache_file_name) % len(self.ques)]
+
+    def put(self, function_cache_manager, block=False):
+        self.que_for(function_cache_manager.cache_file_name).put(function_cache_manager, block=block)
+
+    def join(self):
+        for each_que in self.ques:
+            each_que.join()
+
+    def wait_until_done(self, deadline=None):
+        for each_que in self.ques:
+            with each_que.all_tasks_done:
+                while each_que.unfinished_tasks:
+                    if deadline is None:
+                        each_que.all_tasks_done.wait()
+                    else:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            return False
+                        each_que.all_tasks_done.wait(remaining)
+        return True
 
 # since we only care about latest
 worker_que = None
-worker_thread = None
+# every live cold-storage PerFuncCache (in the order they were created), so flush() can find writes that never made it into the queue
+# (weak so a dropped cached function can release its cache, a manager sitting in the queue is kept alive by the queue)
+all_function_cache_managers = weakref.WeakValueDictionary()
+_function_cache_manager_ids = itertools.count()
+# managers whose write didn't fit in the queue, kept alive until flush() gets them in (even if their function was dropped)
+_managers_with_dropped_writes = set()
+_flush_requested = threading.Event()
+_flush_count_lock = threading.Lock()
+_flush_count = 0
+
+
+# 
+# file fingerprints: (path, hash algorithm, file hash format) -> ((st_dev, st_ino, st_size, st_mtime_ns, st_ctime_ns), content hash)
+# 
+_file_fingerprints = {}
+_file_fingerprints_lock = threading.Lock()
+_file_fingerprints_loaded_from = None
+_file_fingerprints_dirty = False
+# a file modified this recently could change again without a visible mtime change (coarse timestamps), so it's not trusted yet
+_racy_file_seconds = 2
+
+def _load_file_fingerprints():
+    global _file_fingerprints_loaded_from
+    fingerprint_file = settings.file_fingerprint_file
+    if fingerprint_file == _file_fingerprints_loaded_from:
+        return
+    with _file_fingerprints_lock:
+        if fingerprint_file == _file_fingerprints_loaded_from:
+            return
+        if fingerprint_file is not None:
+            try:
+                with open(fingerprint_file, 'rb') as the_file:
+                    for key, value in get_pickle().load(the_file).items():
+                        _file_fingerprints.setdefault(key, value)
+            except Exception as error:
+                # missing or corrupt, it only costs a re-read
+                pass
+            atexit.register(_save_file_fingerprints)
+        _file_fingerprints_loaded_from = fingerprint_file
+
+
+def _save_file_fingerprints():
+    global _file_fingerprints_dirty
+    fingerprint_file = settings.file_fingerprint_file
+    if fingerprint_file is None or not _file_fingerprints_dirty:
+        return
+    with _file_fingerprints_lock:
+        _file_fingerprints_dirty = False
+        fingerprints = dict(_file_fingerprints)
+    # a side file, failing to save it must never keep the caches themselves from being written
+    temp_file = f"{fingerprint_file}.{os.getpid()}.tmp"
+    try:
+        FS.clear_a_path_for(temp_file, overwrite=True)
+        with open(temp_file, 'wb') as the_file:
+            get_pickle().dump(fingerprints, the_file, protocol=4)
+        os.replace(temp_file, fingerprint_file)
+    except Exception as error:
+        FS.remove(temp_file)
+        warnings.warn(f"cool_cache couldn't save file fingerprints to {fingerprint_file}: {error}")
+
+
+class WatchedDirectory:
+    """
+    Return this from watch_filepaths to only watch some of the files in a directory
+        include/exclude: glob patterns (see super_hash.hash_directory), ex: WatchedDirectory("data/", include="*.csv", exclude=["tmp", "raw/*.bak"])
+    Returning a plain directory path watches every file in it.
+    """
+    __slots__ = ("path", "include", "exclude")
+    def __init__(self, path, include=None, exclude=None):
+        self.path = path
+        self.include = include
+        self.exclude = exclude
+
+
+def _fingerprinted_file_hash(filepath, stat_result, hash_format):
+    global _file_fingerprints_dirty
+    key = (path.abspath(filepath), get_hash_algorithm(), hash_format)
+    fingerprint = (stat_result.st_dev, stat_result.st_ino, stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ctime_ns)
+    cached = _file_fingerprints.get(key)
+    if cached is not None and cached[0] == fingerprint:
+        return cached[1]
+    file_hash = hash_file(filepath, hash_format=hash_format)
+    if time.time_ns() - stat_result.st_mtime_ns > _racy_file_seconds * 1_000_000_000:
+        with _file_fingerprints_lock:
+            _file_fingerprints[key] = (fingerprint, file_hash)
+            _file_fingerprints_dirty = True
+    return file_hash
+
+
+def _hash_watched_directory(dirpath, include, exclude, hash_format, strict):
+    if strict:
+        file_hasher = lambda filepath, dir_entry: hash_file(filepath, hash_format=hash_format)
+    else:
+        # scandir already has the stat (on most platforms), so an unchanged directory is validated without reading any file
+        file_hasher = lambda filepath, dir_entry: _fingerprinted_file_hash(filepath, dir_entry.stat(), hash_format)
+    return hash_directory(dirpath, include=include, exclude=exclude, hash_format=hash_format, file_hasher=file_hasher)
+
+
+class InotifyWatcher:
+    """
+    Linux only: remembers which watched files are known to be unchanged since they were last hashed.
+    Each file and its parent directory get an inotify watch, so a write, attribute change, move, delete
+    or replacement of the file (or a move/delete of its directory) marks the file dirty and only then is it re-hashed.
+    Not covered: renaming a directory further up the path, or swapping a symlink that's part of the path.
+    """
+    IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE = 0x2, 0x4, 0x8
+    IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE, IN_DELETE = 0x40, 0x80, 0x100, 0x200
+    IN_DELETE_SELF, IN_MOVE_SELF, IN_Q_OVERFLOW, IN_IGNORED = 0x400, 0x800, 0x4000, 0x8000
+    IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+    file_mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_DELETE_SELF | IN_MOVE_SELF
+    directory_mask = IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        import struct
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._event_header = struct.Struct("iIII")
+        import select
+        # poll(0) is the cheapest way to ask "anything new?" on the hit path
+        self.poller = select.poll()
+        self.poller.register(self.fd, select.POLLIN)
+        self.lock = threading.Lock()
+        self.watch_to_paths = {}      # watch descriptor -> paths (a file watch has one, a directory watch can have many)
+        self.watch_is_directory = {}
+        self.clean_hashes = {}        # path -> { (hash algorithm, file hash format): hash }, only while unchanged
+        self.generation = {}          # path -> count of changes, so a change during hashing isn't lost
+
+    def _watch(self, watched_path, mask, is_directory, filepath):
+        # events on watched_path (the file itself, or its directory) mark filepath dirty
+        watch = self._add_watch(self.fd, os.fsencode(watched_path), mask)
+        if watch < 0:
+            return False
+        self.watch_to_paths.setdefault(watch, set()).add(filepath)
+        self.watch_is_directory[watch] = is_directory
+        return True
+
+    def _mark_dirty(self, path):
+        self.clean_hashes.pop(path, None)
+        self.generation[path] = self.generation.get(path, 0) + 1
+
+    def _drain(self):
+        # usually nothing happened, which costs one poll() syscall
+        while self.poller.poll(0):
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError as error:
+                return
+            offset = 0
+            while offset < len(data):
+                watch, mask, _, name_length = self._event_header.unpack_from(data, offset)
+                offset += self._event_header.size
+                name = data[offset:offset + name_length].rstrip(b"\0")
+                offset += name_length
+                if mask & self.IN_Q_OVERFLOW:
+                    for each_path in tuple(self.clean_hashes):
+                        self._mark_dirty(each_path)
+                    continue
+                paths = self.watch_to_paths.get(watch, ())
+                if self.watch_is_directory.get(watch) and name:
+                    # an entry in the directory changed, only the watched file with that name cares
+                    # (no name means the directory itself was moved/deleted, which affects every file in it)
+                    paths = [ each for each in paths if os.fsencode(path.basename(each)) == name ]
+                for each_path in tuple(paths):
+                    self._mark_dirty(each_path)
+                if mask & self.IN_IGNORED:
+                    self.watch_to_paths.pop(watch, None)
+                    self.watch_is_directory.pop(watch, None)
+
+    def lookup(self, filepath, key):
+        """Returns the hash of filepath if it hasn't changed since it was hashed, otherwise None"""
+        with self.lock:
+            self._drain()
+            return self.clean_hashes.get(filepath, {}).get(key)
+
+    def hash(self, filepath, key, compute_hash):
+        """Watches filepath (before hashing, so no change can slip through) then hashes it"""
+        with self.lock:
+            self._drain()
+            if filepath not in self.generation:
+                self.generation[filepath] = 0
+            # re-adding is cheap and follows the path to a new inode after a replace
+            watched = self._watch(path.dirname(filepath), self.directory_mask, True, filepath) and self._watch(filepath, self.file_mask, False, filepath)
+            generation = self.generation[filepath]
+        file_hash = compute_hash()
+        if watched:
+            with self.lock:
+                self._drain()
+                if self.generation[filepath] == generation:
+                    self.clean_hashes.setdefault(filepath, {})[key] = file_hash
+        return file_hash
+
+
+_inotify_watcher = None
+_inotify_watcher_lock = threading.Lock()
+
+def _get_inotify_watcher():
+    # None = not created yet, False = not available (not linux, no libc inotify, etc)
+    global _inotify_watcher
+    if _inotify_watcher is None:
+        with _inotify_watcher_lock:
+            if _inotify_watcher is None:
+                try:
+                    _inotify_watcher = InotifyWatcher()
+                except Exception as error:
+                    _inotify_watcher = False
+    return _inotify_watcher
+
+
+def _hash_watched_file(filepath):
+    """
+    hash_file, but skips reading files that haven't changed (see settings.file_hash_mode)
+    directories (and WatchedDirectory) get a Merkle hash of the files inside of them
+    """
+    hash_format = settings.file_hash_format
+    file_hash_mode = settings.file_hash_mode
+    if file_hash_mode not in ("stat", "strict", "inotify"):
+        raise ValueError(f"settings.file_hash_mode must be \"stat\", \"strict\" or \"inotify\", got {file_hash_mode!r}")
+    strict = file_hash_mode == "strict"
+    include = exclude = None
+    if isinstance(filepath, WatchedDirectory):
+        filepath, include, exclude = filepath.path, filepath.include, filepath.exclude
+    watcher = None
+    if file_hash_mode == "inotify" and isinstance(filepath, (str, bytes, os.PathLike)):
+        watcher = _get_inotify_watcher() or None
+    if watcher is not None:
+        filepath = os.fsdecode(filepath)
+        if not path.isabs(filepath):
+            filepath = path.abspath(filepath)
+        key = (get_hash_algorithm(), hash_format)
+        # the hit path: no stat, no read
+        file_hash = watcher.lookup(filepath, key)
+        if file_hash is not None:
+            return file_hash
+    try:
+        stat_result = os.stat(filepath)
+    except Exception as error:
+        # missing file, None, etc: hash_file knows what to do
+        return hash_file(filepath, hash_format=hash_format)
+    if stat.S_ISDIR(stat_result.st_mode):
+        if not strict:
+            _load_file_fingerprints()
+        return _hash_watched_directory(filepath, include, exclude, hash_format, strict)
+    if strict or not stat.S_ISREG(stat_result.st_mode):
+        return hash_file(filepath, hash_format=hash_format)
+    _load_file_fingerprints()
+    if watcher is not None:
+        def compute_hash():
+            # stat again now that the watch exists, anything that changes after this gets reported
+            try:
+                return _fingerprinted_file_hash(filepath, os.stat(filepath), hash_format)
+            except OSError as error:
+                return hash_file(filepath, hash_format=hash_format)
+        return watcher.hash(filepath, key, compute_hash)
+    return _fingerprinted_file_hash(filepath, stat_result, hash_format)
+
 
+_file_hash_pool = None
+_file_hash_pool_size = None
+_file_hash_pool_lock = threading.Lock()
 
-def _compute_arg_hash_inputs(args, kwargs, watch_attributes, custom_hasher):
+def _hash_watched_files(filepaths):
+    filepaths = tuple(filepaths)
+    workers = settings.file_hash_workers
+    if not isinstance(workers, int) or workers < 1:
+        raise ValueError(f"settings.file_hash_workers must be an int >= 1, got {workers!r}")
+    if workers == 1 or len(filepaths) < 2:
+        return tuple(_hash_watched_file(each) for each in filepaths)
+    global _file_hash_pool, _file_hash_pool_size
+    with _file_hash_pool_lock:
+        if _file_hash_pool_size != workers:
+            from concurrent.futures import ThreadPoolExecutor
+            if _file_hash_pool is not None:
+                _file_hash_pool.shutdown(wait=False)
+            _file_hash_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cool_cache_file_hash")
+            _file_hash_pool_size = workers
+        pool = _file_hash_pool
+    return tuple(pool.map(_hash_watched_file, filepaths))
+
+
+def _make_sampler(hash_mode, sample_types, sample_bytes):
+    """
+    Returns None (hash everything fully) or a function that swaps sample_types arguments for their sampled hash
+    """
+    if hash_mode == "full":
+        return None
+    if hash_mode != "sampled":
+        raise ValueError(f"hash_mode must be \"full\" or \"sampled\", got {hash_mode!r}")
+    if isinstance(sample_types, type):
+        sample_types = (sample_types,)
+    sample_types = tuple(sample_types)
+    if len(sample_types) == 0 or not all(isinstance(each, type) for each in sample_types):
+        raise ValueError(f"hash_mode=\"sampled\" needs sample_types, the type (or tuple of types) that are safe to sample, got {sample_types!r}")
+    if not isinstance(sample_bytes, int) or sample_bytes <= 0:
+        raise ValueError(f"sample_bytes must be a positive int, got {sample_bytes!r}")
+    warnings.warn(
+        f"cache(hash_mode=\"sampled\") only hashes about {sample_bytes} bytes of each {'/'.join(each.__name__ for each in sample_types)} argument, "
+        "changes outside of that sample will NOT bust the cache. Only use it for data that is never modified in place (ex: read-only datasets)",
+        stacklevel=3,
+    )
+    def sample(value):
+        if isinstance(value, sample_types):
+            digest = sampled_buffer_hash(value, sample_bytes)
+            if digest is not None:
+                return ("cool_cache:sampled", digest)
+        return value
+    return sample
+
+
+def _memoized_argument(value):
+    # frozen/versioned objects (see super_hash.is_memoizable) are hashed once instead of being pickled with the other arguments
+    if is_memoizable(value):
+        return ("cool_cache:memoized", super_hash(value))
+    # numpy arrays, bytearrays, etc are hashed straight from memory instead of being pickled (copied) with the other arguments
+    digest = buffer_hash(value)
+    if digest is not None:
+        return ("cool_cache:buffer", digest)
+    return value
+
+
+_first_item = operator.itemgetter(0)
+
+def _compute_arg_hash_inputs(args, kwargs, watch_attributes, custom_hasher, sampler=None):
     hashed_args = list(args)
-    # if watching attributes on self, replace first arg
+    # if watching attributes on self, replace first arg (read off the real self, before it's memoized/sampled below)
+    watched_self = 0
     if callable(watch_attributes):
         self = hashed_args[0]
         hashed_args[0] = watch_attributes(self)
+        watched_self = 1
     elif len(watch_attributes) > 0:
         self = hashed_args[0]
         attributes = {}
@@ -83,13 +675,183 @@ def _compute_arg_hash_inputs(args, kwargs, watch_attributes, custom_hasher):
             if hasattr(self, each_attribute):
                 attributes[each_attribute] = getattr(self, each_attribute)
         hashed_args[0] = attributes
+        watched_self = 1
+
+    # sampling/memoizing only applies to the direct arguments, and never overrides a custom_hasher
+    if not callable(custom_hasher):
+        substitute = _memoized_argument if sampler is None else (lambda value: _memoized_argument(sampler(value)))
+        hashed_args[watched_self:] = [ substitute(each) for each in hashed_args[watched_self:] ]
+        kwargs = { key: substitute(value) for key, value in kwargs.items() }
 
     if callable(custom_hasher):
         hashed_args = custom_hasher(*args, **kwargs)
         kwargs = None  # need to exclude kwargs when custom_hasher is present
+    else:
+        # sorted so the order the kwargs were given in doesn't matter (a tuple pickles canonically, a dict would need to be sorted by super_hash)
+        kwargs = tuple(sorted(kwargs.items(), key=_first_item))
     return hashed_args, kwargs
 
 
+_hash_algorithm_in_use = ("md5", None)
+def _sync_hash_algorithm():
+    global _hash_algorithm_in_use
+    wanted = (settings.hash_algorithm, settings.hash_digest_size)
+    if wanted != _hash_algorithm_in_use:
+        set_hash_algorithm(*wanted)
+        _hash_algorithm_in_use = wanted
+
+
+# 
+# function digests: (file, qualname, code, python version, hash algorithm) -> (stat of every source file it depends on, super_hash(function))
+# 
+_function_digest_stores = {}  # digest file -> { key: (source file stats, digest) }
+_function_digests_dirty = set()
+_function_digests_lock = threading.Lock()
+# a source file modified after this process started could differ from the code that's been imported
+_process_started_at_ns = time.time_ns()
+
+def _source_file_stats(source_files):
+    output = []
+    for each in sorted(source_files):
+        try:
+            stat_result = os.stat(each)
+        except Exception as error:
+            # "<stdin>", "<string>", deleted files, etc
+            return None
+        output.append((each, stat_result.st_mtime_ns, stat_result.st_size))
+    return tuple(output)
+
+
+def _function_digest_store(digest_file):
+    store = _function_digest_stores.get(digest_file)
+    if store is None:
+        with _function_digests_lock:
+            store = _function_digest_stores.get(digest_file)
+            if store is None:
+                store = {}
+                try:
+                    with open(digest_file, 'rb') as the_file:
+                        store.update(get_pickle().load(the_file))
+                except Exception as error:
+                    # missing or corrupt, it only costs re-hashing
+                    pass
+                _function_digest_stores[digest_file] = store
+    return store
+
+
+def _save_function_digests():
+    with _function_digests_lock:
+        dirty = tuple(_function_digests_dirty)
+        _function_digests_dirty.clear()
+    for digest_file in dirty:
+        store = dict(_function_digest_stores[digest_file])
+        # keep what other processes saved in the meantime
+        try:
+            with open(digest_file, 'rb') as the_file:
+                store = { **get_pickle().load(the_file), **store }
+        except Exception as error:
+            pass
+        try:
+            FS.clear_a_path_for(digest_file, overwrite=True)
+            temp_file = f"{digest_file}.{os.getpid()}.tmp"
+            with open(temp_file, 'wb') as the_file:
+                get_pickle().dump(store, the_file, protocol=4)
+            os.replace(temp_file, digest_file)
+        except Exception as error:
+            warnings.warn(f"cool_cache couldn't save function digests to {digest_file}: {error}")
+
+
+def _function_digest(input_func, folder):
+    """
+    super_hash(input_func), reused from the last process if none of the source files it depends on changed
+    """
+    function_code = getattr(input_func, "__code__", None)
+    if not settings.persist_function_digests or function_code is None:
+        return super_hash(input_func)
+    try:
+        code_hash = super_hash(marshal.dumps(function_code))
+    except Exception as error:
+        return super_hash(input_func)
+    digest_file = path.join(folder, ".function_digests")
+    store = _function_digest_store(digest_file)
+    key = (function_code.co_filename, getattr(input_func, "__qualname__", None), code_hash, sys.version_info[:2], get_hash_algorithm())
+    cached = store.get(key)
+    if cached is not None and _source_file_stats(file for file, _, _ in cached[0]) == cached[0]:
+        return cached[1]
+    
+    with record_source_files() as source_files:
+        digest = super_hash(input_func)
+    source_stats = _source_file_stats(source_files)
+    # only files that were last modified before this process started (and outside the coarse-mtime window) are known to match the imported code
+    trusted_before_ns = _process_started_at_ns - _racy_file_seconds * 1_000_000_000
+    if source_stats is not None and all(mtime_ns < trusted_before_ns for _, mtime_ns, _ in source_stats):
+        with _function_digests_lock:
+            store[key] = (source_stats, digest)
+            _function_digests_dirty.add(digest_file)
+    return digest
+
+
+def _versioned_function_hash(function_id):
+    # md5 keeps the original format so existing cache files stay valid,
+    # any other algorithm is recorded so a file written with a different algorithm never matches
+    algorithm = get_hash_algorithm()
+    if algorithm == "md5":
+        return function_id
+    return f"{algorithm}:{function_id}"
+
+
+def _compute_arg_hash(args, kwargs, depends_on, watch_attributes, watch_filepaths, custom_hasher, seconds, sampler=None):
+    # fills `seconds` with the time spent in each phase (see CacheStats.phases)
+    _sync_hash_algorithm()
+    start = perf_counter()
+    hashed_args, kwargs_for_hash = _compute_arg_hash_inputs(args, kwargs, watch_attributes, custom_hasher, sampler)
+    checkpoint = perf_counter()
+    seconds["arg_hash_inputs"] = checkpoint - start
+
+    #
+    # filepath hashes
+    #
+    filepaths_to_watch = watch_filepaths(*args, **kwargs)
+    file_hashes = _hash_watched_files(filepaths_to_watch)
+    start, checkpoint = checkpoint, perf_counter()
+    seconds["hash_file"] = checkpoint - start
+
+    dependencies = depends_on()
+    start, checkpoint = checkpoint, perf_counter()
+    seconds["depends_on"] = checkpoint - start
+
+    arg_hash = super_hash((hashed_args, kwargs_for_hash, dependencies, file_hashes))
+    seconds["super_hash"] = perf_counter() - checkpoint
+    return arg_hash
+
+
+def _pickled_size(value):
+    try:
+        return len(get_pickle().dumps(value, protocol=4))
+    except Exception as error:
+        return None
+
+
+def _admit(value_bytes, seconds, stats, min_compute_time, max_value_bytes, adaptive_admission):
+    """
+    Decides if a freshly computed result is worth keeping (see the admission arguments of cache())
+    """
+    compute_seconds = seconds["input_func"]
+    if min_compute_time is not None and compute_seconds < min_compute_time:
+        return False
+    if adaptive_admission:
+        # caching only pays off when recomputing costs more than finding the cache key
+        average_hash_seconds = stats.average_hash_seconds()
+        if average_hash_seconds is None:
+            average_hash_seconds = sum(seconds.get(each, 0) for each in CacheStats.hashing_phases)
+        if compute_seconds <= average_hash_seconds:
+            return False
+    # value_bytes of None means it can't be pickled, so we can't tell how big it is; let it in
+    if max_value_bytes is not None and value_bytes is not None and value_bytes > max_value_bytes:
+        return False
+    return True
+
+
 def _unwrap_entry(entry):
     # returns a _CacheEntry, upgrading legacy raw values in-place-compatible form
     if isinstance(entry, _CacheEntry):
@@ -97,10 +859,21 @@ def _unwrap_entry(entry):
     return _CacheEntry(time.time(), entry)
 
 
-def cache(folder=NotGiven, depends_on=lambda:None, watch_attributes=[], watch_filepaths=lambda *args, **kwargs:[], custom_hasher=None, bust=False, keep_for=NotGiven):
-    global worker_que, worker_thread
+def cache(folder=NotGiven, depends_on=lambda:None, watch_attributes=[], watch_filepaths=lambda *args, **kwargs:[], custom_hasher=None, bust=False, keep_for=NotGiven, on_event=None, min_compute_time=None, max_value_bytes=None, adaptive_admission=False, max_entries=None, max_bytes=None, eviction="lru", hash_mode="full", sample_types=(), sample_bytes=1 << 20):
+    global worker_que
+    _sync_hash_algorithm()
     keep_for_value = settings.default_keep_for if keep_for is NotGiven else keep_for
     keep_for_seconds = parse_keep_for_seconds(keep_for_value)
+    if min_compute_time is not None and not isinstance(min_compute_time, (int, float)):
+        raise ValueError(f"min_compute_time must be None or a number of seconds, got {min_compute_time!r}")
+    if max_value_bytes is not None and not isinstance(max_value_bytes, int):
+        raise ValueError(f"max_value_bytes must be None or an int, got {max_value_bytes!r}")
+    has_admission_policy = min_compute_time is not None or max_value_bytes is not None or adaptive_admission
+    is_bounded = max_entries is not None or max_bytes is not None
+    # validate now, each decorated function gets its own instance
+    EvictionPolicy(eviction, max_entries, max_bytes)
+    needs_value_bytes = max_value_bytes is not None or max_bytes is not None or (is_bounded and eviction == "gdsf")
+    sampler = _make_sampler(hash_mode, sample_types, sample_bytes)
 
     if folder is NotGiven:
         folder = settings.default_folder
@@ -110,138 +883,336 @@ def cache(folder=NotGiven, depends_on=lambda:None, watch_attributes=[], watch_fi
         def decorator_name(input_func):
             in_memory_cache = {}
             mem_lock = threading.Lock()
+            stats = CacheStats(input_func, get_size=lambda: len(in_memory_cache))
+            evictor = EvictionPolicy(eviction, max_entries, max_bytes) if is_bounded else None
             def wrapper(*args, **kwargs):
-                hashed_args, kwargs_for_hash = _compute_arg_hash_inputs(args, kwargs, watch_attributes, custom_hasher)
-
-                #
-                # filepath hashes
-                #
-                filepaths_to_watch = watch_filepaths(*args, **kwargs)
-                file_hashes = tuple(hash_file(each) for each in filepaths_to_watch)
-
+                seconds = {}
                 # check if this arg combination has been used already
-                arg_hash = super_hash((hashed_args, kwargs_for_hash, depends_on(), file_hashes))
+                arg_hash = _compute_arg_hash(args, kwargs, depends_on, watch_attributes, watch_filepaths, custom_hasher, seconds, sampler)
+                tracing = on_event is not None or settings.hooks
+                if tracing:
+                    _emit(on_event, "lookup", stats.name, seconds=sum(seconds.values()), arg_hash=arg_hash)
+                expired = 0
                 with mem_lock:
                     if arg_hash in in_memory_cache:
                         entry = _unwrap_entry(in_memory_cache[arg_hash])
                         in_memory_cache[arg_hash] = entry
                         if is_expired(keep_for_seconds, entry.created_at):
                             in_memory_cache.pop(arg_hash, None)
+                            if evictor is not None:
+                                evictor.discard(arg_hash)
+                            expired = 1
                         else:
+                            if evictor is not None:
+                                entry.frequency += 1
+                                evictor.touch(arg_hash, entry)
+                            stats.record(seconds, hits=1)
+                            if tracing:
+                                _emit(on_event, "hit", stats.name, arg_hash=arg_hash)
                             return entry.value
+                if tracing:
+                    _emit(on_event, "expiry" if expired else "miss", stats.name, arg_hash=arg_hash)
                 # if args not in cache, run the function
+                start = perf_counter()
                 result = input_func(*args, **kwargs)
+                seconds["input_func"] = perf_counter() - start
+                if tracing:
+                    _emit(on_event, "compute", stats.name, seconds=seconds["input_func"], arg_hash=arg_hash)
+                value_bytes = _pickled_size(result) if needs_value_bytes else None
+                if has_admission_policy and not _admit(value_bytes, seconds, stats, min_compute_time, max_value_bytes, adaptive_admission):
+                    stats.record(seconds, misses=1, expired=expired, rejected=1)
+                    return result
+                entry = _CacheEntry(time.time(), result, compute_seconds=seconds["input_func"], value_bytes=value_bytes)
+                evicted = ()
                 with mem_lock:
-                    in_memory_cache[arg_hash] = _CacheEntry(time.time(), result)
+                    in_memory_cache[arg_hash] = entry
+                    if evictor is not None:
+                        evictor.touch(arg_hash, entry)
+                        evicted = evictor.evict()
+                        for each_key in evicted:
+                            in_memory_cache.pop(each_key, None)
+                stats.record(seconds, misses=1, expired=expired, evictions=len(evicted))
+                if tracing:
+                    for each_key in evicted:
+                        _emit(on_event, "eviction", stats.name, arg_hash=each_key)
                 return result
+            wrapper.cache_info = stats.info
             return wrapper
         return decorator_name
 
     # save in cold storage
     else:
-        import queue
         if worker_que is None:
-            worker_que = queue.Queue(maxsize=settings.worker_que_size)
-            worker_thread = threading.Thread(target=worker, daemon=True)
-            worker_thread.start()
+            worker_que = WriterPool(settings.writer_threads, settings.worker_que_size)
+            atexit.register(_flush_at_exit)
         def real_decorator(input_func):
             function_cache_manager = PerFuncCache()
-            function_id = super_hash(input_func)
-            function_cache_manager.cache_file_name = path.join(folder, f'{function_id}.pickle')
-            function_cache_manager.deep_hash = function_id
-            if bust:
-                FS.remove(function_cache_manager.cache_file_name)
+            all_function_cache_managers[next(_function_cache_manager_ids)] = function_cache_manager
+            stats = function_cache_manager.stats = CacheStats(input_func, get_size=lambda: len(function_cache_manager.arg_hash_to_value))
+            function_cache_manager.on_event = on_event
+            evictor = EvictionPolicy(eviction, max_entries, max_bytes) if is_bounded else None
+            def bind_cache_file():
+                # hashing the function can be slow (it walks everything the function calls), see settings.lazy_function_hash
+                function_id = _function_digest(input_func, folder)
+                function_cache_manager.cache_file_name = path.join(folder, f'{function_id}.pickle')
+                function_cache_manager.deep_hash = _versioned_function_hash(function_id)
+                function_cache_manager.hash_algorithm = get_hash_algorithm()
+                if bust:
+                    FS.remove(function_cache_manager.cache_file_name)
+            if not settings.lazy_function_hash:
+                bind_cache_file()
             def wrapper(*args, **kwargs):
+                seconds = {}
+                _sync_hash_algorithm()
+                if function_cache_manager.hash_algorithm not in (None, get_hash_algorithm()):
+                    # settings.hash_algorithm changed after the cache file was picked: finish writing the old file,
+                    # then switch to the new algorithm's file (keys from two algorithms never share a file)
+                    flush()
+                    with function_cache_manager.lock:
+                        if function_cache_manager.hash_algorithm not in (None, get_hash_algorithm()):
+                            if evictor is not None:
+                                for each_key in function_cache_manager.arg_hash_to_value:
+                                    evictor.discard(each_key)
+                            _unbind_cache_file(function_cache_manager)
                 # load cached values for this function (once, under lock)
                 with function_cache_manager.lock:
                     if not function_cache_manager.calculated:
+                        start = perf_counter()
+                        if not function_cache_manager.cache_file_name:
+                            bind_cache_file()
                         if path.exists(function_cache_manager.cache_file_name):
                             try:
                                 with open(function_cache_manager.cache_file_name, 'rb') as cache_file:
                                     func_hash, cache_temp = get_pickle().load(cache_file)
                                     if func_hash == function_cache_manager.deep_hash:
                                         function_cache_manager.arg_hash_to_value = cache_temp
+                                        function_cache_manager.persisted = dict(cache_temp)
+                                        if evictor is not None:
+                                            _load_into_evictor(evictor, function_cache_manager)
                             except Exception as error:
                                 # auto remove corrupted files
                                 FS.remove(function_cache_manager.cache_file_name)
+                                if on_event is not None or settings.hooks:
+                                    _emit(on_event, "corruption_removal", stats.name, cache_file_name=function_cache_manager.cache_file_name)
                         function_cache_manager.calculated = True
-
-                hashed_args, kwargs_for_hash = _compute_arg_hash_inputs(args, kwargs, watch_attributes, custom_hasher)
-
-                #
-                # filepath hashes
-                #
-                filepaths_to_watch = watch_filepaths(*args, **kwargs)
-                file_hashes = tuple(hash_file(each) for each in filepaths_to_watch)
+                        seconds["load"] = perf_counter() - start
+                        if on_event is not None or settings.hooks:
+                            _emit(on_event, "file_load", stats.name, seconds=seconds["load"], cache_file_name=function_cache_manager.cache_file_name)
 
                 # check if this arg combination has been used already
-                arg_hash = super_hash((hashed_args, kwargs_for_hash, depends_on(), file_hashes))
+                arg_hash = _compute_arg_hash(args, kwargs, depends_on, watch_attributes, watch_filepaths, custom_hasher, seconds, sampler)
+                tracing = on_event is not None or settings.hooks
+                if tracing:
+                    _emit(on_event, "lookup", stats.name, seconds=sum(seconds.values()) - seconds.get("load", 0), arg_hash=arg_hash)
+                expired = 0
                 with function_cache_manager.lock:
                     arg_hash_to_value = function_cache_manager.arg_hash_to_value
                     if arg_hash in arg_hash_to_value:
                         entry = _unwrap_entry(arg_hash_to_value[arg_hash])
                         arg_hash_to_value[arg_hash] = entry
                         if not is_expired(keep_for_seconds, entry.created_at):
+                            if evictor is not None:
+                                entry.frequency += 1
+                                evictor.touch(arg_hash, entry)
+                            stats.record(seconds, hits=1)
+                            if tracing:
+                                _emit(on_event, "hit", stats.name, arg_hash=arg_hash)
                             return entry.value
                         else:
                             arg_hash_to_value.pop(arg_hash, None)
+                            function_cache_manager.dirty_keys.add(arg_hash)
+                            if evictor is not None:
+                                evictor.discard(arg_hash)
+                            expired = 1
+                if tracing:
+                    _emit(on_event, "expiry" if expired else "miss", stats.name, arg_hash=arg_hash)
 
                 # if args not in cache, run the function
+                start = perf_counter()
                 result = input_func(*args, **kwargs)
+                seconds["input_func"] = perf_counter() - start
+                if tracing:
+                    _emit(on_event, "compute", stats.name, seconds=seconds["input_func"], arg_hash=arg_hash)
+                value_bytes = _pickled_size(result) if needs_value_bytes else None
+                if has_admission_policy and not _admit(value_bytes, seconds, stats, min_compute_time, max_value_bytes, adaptive_admission):
+                    if expired:
+                        # still need to persist the removal of the expired entry
+                        _enqueue_write(function_cache_manager)
+                    stats.record(seconds, misses=1, expired=expired, rejected=1)
+                    return result
 
+                entry = _CacheEntry(time.time(), result, compute_seconds=seconds["input_func"], value_bytes=value_bytes)
+                evicted = ()
                 with function_cache_manager.lock:
-                    function_cache_manager.arg_hash_to_value[arg_hash] = _CacheEntry(time.time(), result)
-                    # shallow snapshot under the lock so the worker can
-                    # iterate/pickle a stable mapping without racing writers
-                    snapshot = dict(function_cache_manager.arg_hash_to_value)
-                    cache_file_name = function_cache_manager.cache_file_name
-                    deep_hash = function_cache_manager.deep_hash
-
-                data_to_push = PerFuncCache()
-                data_to_push.calculated = True
-                data_to_push.cache_file_name = cache_file_name
-                data_to_push.deep_hash = deep_hash
-                data_to_push.arg_hash_to_value = snapshot
-                try:
-                    worker_que.put(data_to_push, block=False)  # use a different process for saving to disk to prevent slowdown
-                except queue.Full:
-                    # drop this enqueue; the next successful put will supersede it anyway
-                    pass
+                    function_cache_manager.arg_hash_to_value[arg_hash] = entry
+                    # only record which key changed; the worker merges it into the
+                    # persisted mapping so a miss is O(1) no matter how big the cache is
+                    function_cache_manager.dirty_keys.add(arg_hash)
+                    if evictor is not None:
+                        evictor.touch(arg_hash, entry)
+                        evicted = evictor.evict()
+                        for each_key in evicted:
+                            function_cache_manager.arg_hash_to_value.pop(each_key, None)
+                            function_cache_manager.dirty_keys.add(each_key)
+
+                start = perf_counter()
+                _enqueue_write(function_cache_manager)  # use a different thread for saving to disk to prevent slowdown
+                if tracing:
+                    _emit(on_event, "enqueue", stats.name, seconds=perf_counter() - start, arg_hash=arg_hash, cache_file_name=function_cache_manager.cache_file_name)
+                stats.record(seconds, misses=1, expired=expired, evictions=len(evicted))
+                if tracing:
+                    for each_key in evicted:
+                        _emit(on_event, "eviction", stats.name, arg_hash=each_key)
                 return result
+            wrapper.cache_info = stats.info
             return wrapper
         return real_decorator
 
-def worker():
-    global worker_que
-    import queue
+def _unbind_cache_file(function_cache_manager):
+    # called with function_cache_manager.lock held, the next call binds (and loads) the cache file again
+    function_cache_manager.calculated = False
+    function_cache_manager.cache_file_name = ""
+    function_cache_manager.deep_hash = ""
+    function_cache_manager.hash_algorithm = None
+    function_cache_manager.arg_hash_to_value = {}
+    function_cache_manager.dirty_keys = set()
+    function_cache_manager.persisted = {}
+
+
+def _load_into_evictor(evictor, function_cache_manager):
+    # called with function_cache_manager.lock held, right after loading the cache file
+    arg_hash_to_value = function_cache_manager.arg_hash_to_value
+    for each_key, each_entry in tuple(arg_hash_to_value.items()):
+        entry = _unwrap_entry(each_entry)
+        if entry.value_bytes is None and evictor.needs_value_bytes:
+            entry.value_bytes = _pickled_size(entry.value)
+        arg_hash_to_value[each_key] = entry
+        evictor.touch(each_key, entry)
+    # the limits might have been lowered since the file was written
+    evicted = evictor.evict()
+    for each_key in evicted:
+        arg_hash_to_value.pop(each_key, None)
+        function_cache_manager.dirty_keys.add(each_key)
+    if evicted and function_cache_manager.stats is not None:
+        function_cache_manager.stats.record({}, evictions=len(evicted))
 
-    while threading.main_thread().is_alive():
-        try:
-            first = worker_que.get(timeout=0.1)  # 0.1 second. Allows for checking if the main thread is alive
-        except queue.Empty:
-            continue
 
-        # drain the queue but keep only the latest snapshot PER cache file
+def _enqueue_write(function_cache_manager, block=False):
+    with function_cache_manager.lock:
+        if function_cache_manager.write_pending:
+            return
+        function_cache_manager.write_pending = True
+    try:
+        worker_que.put(function_cache_manager, block=block)
+    except queue.Full:
+        # keys stay dirty, so the next miss (or flush()) will retry the enqueue
+        with function_cache_manager.lock:
+            function_cache_manager.write_pending = False
+        _managers_with_dropped_writes.add(function_cache_manager)
+
+
+def worker(que):
+    while True:
+        first = que.get()  # blocks until there's something to write; the thread is a daemon
+        # debounce: let a burst of misses pile up so the file is rewritten once, not per miss
+        # (flush() sets _flush_requested to cut the wait short)
+        if settings.flush_interval:
+            _flush_requested.wait(settings.flush_interval)
+
+        # drain the queue, one write per function
         # (so writes for function A don't clobber pending writes for function B)
-        pending = {first.cache_file_name: first}
+        pending = {id(first): first}
         get_count = 1
         while True:
             try:
-                item = worker_que.get(block=False)
+                item = que.get(block=False)
             except queue.Empty:
                 break
-            pending[item.cache_file_name] = item
+            pending[id(item)] = item
             get_count += 1
 
         for item in pending.values():
             try:
-                FS.clear_a_path_for(item.cache_file_name, overwrite=True)
-                with open(item.cache_file_name, 'wb') as cache_file:
-                    get_pickle().dump((item.deep_hash, item.arg_hash_to_value), cache_file, protocol=4)
+                _write_dirty_entries(item)
             except Exception:
                 pass
+        # don't keep the last batch of caches alive while waiting for the next one
+        first = item = pending = None
         for _ in range(get_count):
-            worker_que.task_done()
+            que.task_done()
+
+
+def flush(timeout=None):
+    """
+    Write every pending cold-storage cache to disk, waiting at most `timeout` seconds.
+    Returns True if everything was written, False if the timeout was hit.
+    """
+    global _flush_count
+    _save_file_fingerprints()
+    _save_function_digests()
+    if worker_que is None:
+        return True
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _flush_count_lock:
+        _flush_count += 1
+        _flush_requested.set()
+    try:
+        # pick up writes that were dropped because the queue was full
+        for each_manager in set(all_function_cache_managers.values()) | _managers_with_dropped_writes:
+            _managers_with_dropped_writes.discard(each_manager)
+            if each_manager.dirty_keys:
+                _enqueue_write(each_manager, block=deadline is None)
+        return worker_que.wait_until_done(deadline)
+    finally:
+        with _flush_count_lock:
+            _flush_count -= 1
+            if _flush_count == 0:
+                _flush_requested.clear()
+
+
+def _flush_at_exit():
+    flush(timeout=settings.exit_flush_timeout)
+
+
+def _write_dirty_entries(function_cache_manager):
+    # grab the dirty keys (O(changes), not O(cache size)) and let new misses re-enqueue
+    with function_cache_manager.lock:
+        dirty_keys = function_cache_manager.dirty_keys
+        function_cache_manager.dirty_keys = set()
+        function_cache_manager.write_pending = False
+        arg_hash_to_value = function_cache_manager.arg_hash_to_value
+        changes = [ (each_key, arg_hash_to_value.get(each_key, NotGiven)) for each_key in dirty_keys ]
+        # taken together, so a cache file that's re-bound mid-write (see _unbind_cache_file) still gets its own entries
+        persisted = function_cache_manager.persisted
+        cache_file_name = function_cache_manager.cache_file_name
+        deep_hash = function_cache_manager.deep_hash
+    if not cache_file_name:
+        # un-bound since this write was queued, its entries were written by the flush before that
+        return
+
+    # merge into the writer-owned mapping, outside of the function lock
+    for each_key, each_entry in changes:
+        if each_entry is NotGiven:
+            persisted.pop(each_key, None)
+        else:
+            persisted[each_key] = each_entry
+
+    start = perf_counter()
+    # written to a temp file and swapped in, so a write cut short (ex: the exit flush giving up) never leaves a truncated (or missing) cache file
+    temp_file = f"{cache_file_name}.{os.getpid()}.tmp"
+    FS.clear_a_path_for(temp_file, overwrite=True)
+    try:
+        with open(temp_file, 'wb') as cache_file:
+            get_pickle().dump((deep_hash, persisted), cache_file, protocol=4)
+        os.replace(temp_file, cache_file_name)
+    except Exception as error:
+        FS.remove(temp_file)
+        raise
+    duration = perf_counter() - start
+    if function_cache_manager.stats is not None:
+        function_cache_manager.stats.record({ "persist": duration })
+        if function_cache_manager.on_event is not None or settings.hooks:
+            _emit(function_cache_manager.on_event, "file_write", function_cache_manager.stats.name, seconds=duration, cache_file_name=cache_file_name)
 
 
 def parse_keep_for_seconds(keep_for):
@@ -0,0 +1,168 @@
+"""
+End-to-end benchmarks for the @cache decorator.
+
+Workloads:
+  * hit_latency       seconds per cache hit, folder=None vs cold storage
+  * miss_overhead     seconds per miss on top of calling the bare function
+  * load_time         first-call load time vs number of entries / bytes in the cache file
+  * persist           how long the writer takes to rewrite a cache file of a given size
+  * contention        hits per second with 1-64 threads sharing one cached function
+
+Everything runs offline with only the standard library. Results are printed and
+written as JSON (see common.write_results) so runs from two releases can be compared.
+
+Run via: PYTHONPATH=main python3 tests/benchmarks/bench_decorator.py [--quick] [--output path.json] [--compare old.json]
+     or: ./run/benchmark
+"""
+
+import argparse
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from time import perf_counter
+
+from common import seconds_per_call, write_results, read_results, print_results, compare_results
+
+import cool_cache
+from cool_cache import cache, settings
+
+
+def bare(x):
+    return x
+
+
+def make_function(name, offset, payload=None):
+    # each function needs a different body so it gets its own cache file
+    namespace = dict(payload=payload)
+    exec(f"def {name}(x):\n    return (x, {offset}, payload)\n", namespace)
+    return namespace[name]
+
+
+def bench_hit_latency(folder, number):
+    results = {}
+    results["bare_call"] = dict(seconds_per_call=seconds_per_call(lambda: bare(1), number))
+    for label, each_folder in (("in_memory", None), ("cold_storage", folder)):
+        cached = cache(folder=each_folder)(make_function(f"hit_{label}", 1))
+        cached(1)
+        results[f"hit_latency/{label}"] = dict(seconds_per_call=seconds_per_call(lambda: cached(1), number))
+    cool_cache.flush()
+    return results
+
+
+def bench_miss_overhead(folder, number):
+    results = {}
+    bare_seconds = seconds_per_call(lambda: bare(1), number)
+    for label, each_folder in (("in_memory", None), ("cold_storage", folder)):
+        cached = cache(folder=each_folder)(make_function(f"miss_{label}", 2))
+        counter = itertools.count()
+        per_call = seconds_per_call(lambda: cached(next(counter)), number)
+        results[f"miss_overhead/{label}"] = dict(
+            seconds_per_call=per_call,
+            overhead_seconds=per_call - bare_seconds,
+        )
+    cool_cache.flush()
+    return results
+
+
+def bench_load_time_and_persist(folder, sizes, value_bytes):
+    results = {}
+    payload = b"x" * value_bytes
+    for size in sizes:
+        function = make_function(f"load_{size}", size, payload)
+        cached = cache(folder=folder)(function)
+        for index in range(size):
+            cached(index)
+        cool_cache.flush()
+        # one more miss => exactly one rewrite of the whole file
+        persist_before = cached.cache_info()["seconds"]["persist"]
+        cached(size)
+        cool_cache.flush()
+        write_seconds = cached.cache_info()["seconds"]["persist"] - persist_before
+
+        cache_file_name = list(cool_cache.all_function_cache_managers.values())[-1].cache_file_name
+        file_bytes = os.path.getsize(cache_file_name)
+
+        # decorating again gives a fresh manager, so the next call loads the file
+        reloaded = cache(folder=folder)(function)
+        reloaded(0)
+        load_seconds = reloaded.cache_info()["seconds"]["load"]
+
+        results[f"load_time/{size}_entries"] = dict(
+            file_bytes=file_bytes,
+            load_seconds=load_seconds,
+            megabytes_per_second=file_bytes / 1e6 / load_seconds if load_seconds else 0.0,
+        )
+        results[f"persist/{size}_entries"] = dict(
+            file_bytes=file_bytes,
+            write_seconds=write_seconds,
+            megabytes_per_second=file_bytes / 1e6 / write_seconds if write_seconds else 0.0,
+        )
+    return results
+
+
+def bench_contention(folder, thread_counts, calls_per_thread):
+    results = {}
+    for label, each_folder in (("in_memory", None), ("cold_storage", folder)):
+        cached = cache(folder=each_folder)(make_function(f"contention_{label}", 3))
+        for key in range(8):
+            cached(key)
+        for thread_count in thread_counts:
+            barrier = threading.Barrier(thread_count + 1)
+            def work(offset):
+                barrier.wait()
+                for index in range(calls_per_thread):
+                    cached((index + offset) % 8)
+            threads = [ threading.Thread(target=work, args=(offset,)) for offset in range(thread_count) ]
+            for each in threads:
+                each.start()
+            barrier.wait()
+            start = perf_counter()
+            for each in threads:
+                each.join()
+            duration = perf_counter() - start
+            results[f"contention/{label}/{thread_count}_threads"] = dict(
+                calls_per_second=thread_count * calls_per_thread / duration,
+                seconds=duration,
+            )
+    cool_cache.flush()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller workloads, for a smoke test")
+    parser.add_argument("--output", default="bench_results/decorator.json", help="where to write the JSON results")
+    parser.add_argument("--compare", default=None, help="a previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=1.5, help="with --compare, exit 1 if anything is this many times slower")
+    args = parser.parse_args()
+    previous_results = args.compare and read_results(args.compare, quick=args.quick)
+
+    if args.quick:
+        number, sizes, value_bytes, thread_counts, calls_per_thread = 200, [100, 1000], 100, [1, 4, 16], 200
+    else:
+        number, sizes, value_bytes, thread_counts, calls_per_thread = 5000, [100, 1000, 10000, 100000], 100, [1, 2, 4, 8, 16, 32, 64], 2000
+
+    folder = tempfile.mkdtemp(prefix="cool_cache_bench_")
+    try:
+        results = {}
+        results.update(bench_hit_latency(folder, number))
+        results.update(bench_miss_overhead(folder, number))
+        results.update(bench_load_time_and_persist(folder, sizes, value_bytes))
+        results.update(bench_contention(folder, thread_counts, calls_per_thread))
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    print_results(results)
+    write_results(args.output, "decorator", results, quick=args.quick)
+    print(f"wrote {args.output}")
+    if args.compare:
+        print(f"compared to {args.compare}:")
+        if compare_results(previous_results, results, threshold=args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
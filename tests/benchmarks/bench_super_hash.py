@@ -0,0 +1,164 @@
+"""
+Microbenchmarks for super_hash, consistent_hash and hash_file.
+
+Payloads cover what real cached functions get called with: nested dicts, long
+lists of small ints, big strings/bytes, NumPy arrays (skipped if numpy isn't
+installed), dataclasses, functions/lambdas, sets, recursive structures, the
+(formerly pathological) long list of tuples, and the key tuples cool_cache
+hashes on every call.
+
+A baseline is stored in tests/benchmarks/baselines/super_hash.json. Timings
+are machine specific, so the baseline is only meaningful on comparable
+hardware; regenerate it with --update-baseline when hashing intentionally
+changes. --quick shrinks the payloads, so its results are only compared
+against other --quick results (and never written to the baseline).
+
+Run via: PYTHONPATH=main python3 tests/benchmarks/bench_super_hash.py [--quick] [--baseline] [--update-baseline] [--hash-algorithm blake2b]
+"""
+
+import argparse
+import dataclasses
+import os
+import shutil
+import sys
+import tempfile
+
+from common import HERE, adaptive_seconds_per_call, write_results, read_results, print_results, compare_results
+
+from cool_cache.__dependencies__.super_hash import super_hash, consistent_hash, hash_file, set_hash_algorithm
+
+BASELINE_PATH = os.path.join(HERE, "baselines", "super_hash.json")
+# --quick shrinks these along with the payloads
+timing_options = dict(min_round_time=0.05, rounds=5)
+
+
+@dataclasses.dataclass
+class Point:
+    x: float
+    y: float
+    label: str
+
+
+def module_level_function(a, b):
+    return helper_function(a) + b
+
+
+def helper_function(a):
+    return a * 2
+
+
+def nested_dict(depth, fanout):
+    if depth == 0:
+        return 1
+    return { f"key_{index}": nested_dict(depth - 1, fanout) for index in range(fanout) }
+
+
+def recursive_structure(size):
+    # the lambda makes pickle fail, forcing super_hash down its recursive fallback
+    items = [ { "index": index, "callback": (lambda value: value) } for index in range(size) ]
+    items.append(items)
+    return items
+
+
+def payloads(quick):
+    scale = 10 if quick else 1
+    result = {
+        "small_int": 42,
+        "short_str": "hello world",
+        "nested_dict_depth4_fanout8": nested_dict(4, 8),
+        "list_of_small_ints": list(range(1_000_000 // scale)),
+        "large_string": "x" * (10_000_000 // scale),
+        "large_bytes": b"x" * (10_000_000 // scale),
+        "list_of_tuples": [ (index, index) for index in range(1_000_000 // scale) ],
+        "set_of_strings": { f"item_{index}" for index in range(100_000 // scale) },
+        "dataclasses": [ Point(index, index, "point") for index in range(10_000 // scale) ],
+        "module_level_function": module_level_function,
+        "lambda": (lambda value: value + 1),
+        "list_with_callbacks": recursive_structure(1_000 // scale),
+        "nested_dict_with_one_callback": { "config": nested_dict(4, 8), "callback": module_level_function },
+        # what cool_cache hashes on every call: (args, sorted kwargs, depends_on(), watched file hashes)
+        "key_tuple_small_args": ([ 3, "name" ], (), None, []),
+        "key_tuple_list_arg": ([ list(range(100_000 // scale)) ], (), None, []),
+        "key_tuple_dict_arg": ([ { "lr": 0.1, "layers": [64, 32], "name": "run" } ], (("verbose", True),), None, []),
+    }
+    try:
+        import numpy
+        result["numpy_float64_1M"] = numpy.arange(1_000_000 // scale, dtype=numpy.float64)
+        result["numpy_non_contiguous"] = numpy.arange(2_000_000 // scale, dtype=numpy.float64).reshape(-1, 2)[:, 0]
+    except ImportError:
+        pass
+    return result
+
+
+def bench_super_hash(quick):
+    results = {}
+    for name, value in payloads(quick).items():
+        results[f"super_hash/{name}"] = dict(seconds_per_call=adaptive_seconds_per_call(lambda: super_hash(value), **timing_options))
+    return results
+
+
+def bench_consistent_hash(quick):
+    scale = 10 if quick else 1
+    results = {}
+    for name, value in (("bytes_10MB", b"x" * (10_000_000 // scale)), ("str_10MB", "x" * (10_000_000 // scale)), ("int", 42)):
+        results[f"consistent_hash/{name}"] = dict(seconds_per_call=adaptive_seconds_per_call(lambda: consistent_hash(value), **timing_options))
+    return results
+
+
+def bench_hash_file(quick):
+    results = {}
+    folder = tempfile.mkdtemp(prefix="cool_cache_bench_")
+    try:
+        for megabytes in ((1, 8) if quick else (1, 64)):
+            filepath = os.path.join(folder, f"{megabytes}MB.bin")
+            with open(filepath, "wb") as the_file:
+                the_file.write(os.urandom(megabytes * 1_000_000))
+            seconds = adaptive_seconds_per_call(lambda: hash_file(filepath), **timing_options)
+            results[f"hash_file/{megabytes}MB"] = dict(
+                seconds_per_call=seconds,
+                megabytes_per_second=megabytes / seconds,
+            )
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller payloads, for a smoke test")
+    parser.add_argument("--output", default="bench_results/super_hash.json", help="where to write the JSON results")
+    parser.add_argument("--compare", default=None, help="a previous results file to compare against")
+    parser.add_argument("--baseline", action="store_true", help="compare against the stored baseline")
+    parser.add_argument("--update-baseline", action="store_true", help="overwrite the stored baseline with these results")
+    parser.add_argument("--hash-algorithm", default="md5", help="md5, blake2b, blake2s or xxhash")
+    parser.add_argument("--threshold", type=float, default=1.5, help="with --compare/--baseline, exit 1 if anything is this many times slower")
+    args = parser.parse_args()
+    if args.quick and args.update_baseline:
+        parser.error("--update-baseline needs a full run (--quick payloads are smaller than the baseline's)")
+    compare_path = BASELINE_PATH if args.baseline else args.compare
+    # read before running, so a mismatched --quick fails without waiting on the whole run
+    previous_results = compare_path and read_results(compare_path, quick=args.quick)
+    if args.quick:
+        timing_options.update(min_round_time=0.005, rounds=3)
+    set_hash_algorithm(args.hash_algorithm)
+
+    results = {}
+    results.update(bench_super_hash(args.quick))
+    results.update(bench_consistent_hash(args.quick))
+    results.update(bench_hash_file(args.quick))
+
+    print_results(results)
+    write_results(args.output, "super_hash", results, quick=args.quick)
+    print(f"wrote {args.output}")
+    if args.update_baseline:
+        write_results(BASELINE_PATH, "super_hash", results, quick=args.quick)
+        print(f"wrote {BASELINE_PATH}")
+
+    if compare_path:
+        print(f"compared to {compare_path}:")
+        if compare_results(previous_results, results, threshold=args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
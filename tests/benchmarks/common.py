@@ -0,0 +1,134 @@
+"""
+Shared helpers for the benchmark scripts in tests/benchmarks/.
+
+Every benchmark produces a flat {workload_name: {metric_name: number}} dict
+which gets written as JSON next to some metadata about the machine, so two
+result files (e.g. from two releases) can be diffed by a script.
+"""
+
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from time import perf_counter
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(os.path.dirname(HERE))
+PACKAGE_PATH = os.path.join(REPO, "main")
+
+# make `import cool_cache` work without needing PYTHONPATH
+if PACKAGE_PATH not in sys.path:
+    sys.path.insert(0, PACKAGE_PATH)
+
+
+def seconds_per_call(function, number, rounds=5):
+    """
+    Calls `function` `number` times per round, returns the median seconds per call across rounds
+    (the median is less noisy than the mean on a shared machine, and less optimistic than the min)
+    """
+    per_call = []
+    for _ in range(rounds):
+        start = perf_counter()
+        for _ in range(number):
+            function()
+        per_call.append((perf_counter() - start) / number)
+    return statistics.median(per_call)
+
+
+def adaptive_seconds_per_call(function, min_round_time=0.05, rounds=5):
+    """
+    Like seconds_per_call, but picks how many calls per round so that each round takes at least min_round_time
+    (lets one harness cover payloads that take nanoseconds and payloads that take seconds)
+    """
+    number = 1
+    while True:
+        start = perf_counter()
+        for _ in range(number):
+            function()
+        duration = perf_counter() - start
+        if duration >= min_round_time or number >= 1_000_000:
+            break
+        number *= 10 if duration < min_round_time / 10 else 2
+    return seconds_per_call(function, number, rounds=rounds)
+
+
+def metadata():
+    return dict(
+        python=platform.python_version(),
+        implementation=platform.python_implementation(),
+        platform=platform.platform(),
+        machine=platform.machine(),
+        cpu_count=os.cpu_count(),
+        timestamp=time.time(),
+    )
+
+
+def write_results(output_path, suite_name, results, quick=False):
+    # --quick shrinks the payloads (not just the timing), so it's recorded to keep the two kinds of runs from being compared
+    data = dict(suite=suite_name, metadata=dict(metadata(), quick=quick), results=results)
+    folder = os.path.dirname(os.path.abspath(output_path))
+    os.makedirs(folder, exist_ok=True)
+    with open(output_path, "w") as the_file:
+        json.dump(data, the_file, indent=4, sort_keys=True)
+    return data
+
+
+def read_results(path, quick=None):
+    """
+    Returns the results stored at `path`, if `quick` is given it exits when they came from the other kind of run
+    """
+    with open(path, "r") as the_file:
+        data = json.load(the_file)
+    recorded_quick = data.get("metadata", {}).get("quick", False)
+    if quick is not None and recorded_quick != quick:
+        raise SystemExit(f"{path} is from a {'--quick' if recorded_quick else 'full'} run, it can't be compared against a {'--quick' if quick else 'full'} run")
+    return data["results"]
+
+
+def is_lower_better(metric_name):
+    # only timing metrics are compared, sizes and counts are just for context
+    if metric_name.endswith("per_second"):
+        return False
+    if "seconds" in metric_name:
+        return True
+    return None
+
+
+def compare_results(baseline, current, threshold=1.5):
+    """
+    Prints a comparison table and returns the list of (workload, metric, ratio) that
+    got worse by more than `threshold` (ratio is always "how many times worse", >1 is worse)
+    """
+    regressions = []
+    print(f"  {'workload/metric':<60} {'baseline':>12} {'current':>12} {'x worse':>8}")
+    for workload_name, metrics in current.items():
+        for metric_name, value in metrics.items():
+            lower_is_better = is_lower_better(metric_name)
+            baseline_value = baseline.get(workload_name, {}).get(metric_name, None)
+            if lower_is_better is None or not baseline_value or not value:
+                continue
+            ratio = value / baseline_value if lower_is_better else baseline_value / value
+            marker = ""
+            if ratio > threshold:
+                marker = "  REGRESSION"
+                regressions.append((workload_name, metric_name, ratio))
+            print(f"  {workload_name + '/' + metric_name:<60} {format_number(baseline_value):>12} {format_number(value):>12} {ratio:>8.2f}{marker}")
+    for workload_name in baseline:
+        if workload_name not in current:
+            print(f"  {workload_name:<60} (missing from current results)")
+    return regressions
+
+
+def print_results(results):
+    for workload_name, metrics in results.items():
+        print(f"  {workload_name}")
+        for metric_name, value in metrics.items():
+            print(f"      {metric_name:<28} {format_number(value)}")
+
+
+def format_number(value):
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    return str(value)
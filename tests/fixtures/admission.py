@@ -0,0 +1,57 @@
+"""min_compute_time / max_value_bytes / adaptive_admission: only worthwhile results get stored."""
+import os
+import pickle
+import sys
+import time
+import cool_cache
+from cool_cache import cache
+
+cache_dir = sys.argv[1]
+calls = []
+
+@cache(folder=None, min_compute_time=0.02)
+def maybe_slow(x, delay):
+    calls.append(("maybe_slow", x))
+    time.sleep(delay)
+    return x
+
+maybe_slow(1, 0); maybe_slow(1, 0)
+maybe_slow(2, 0.03); maybe_slow(2, 0.03)
+assert calls == [("maybe_slow", 1), ("maybe_slow", 1), ("maybe_slow", 2)], calls
+info = maybe_slow.cache_info()
+assert (info["rejected"], info["size"], info["hits"]) == (2, 1, 1), info
+
+del calls[:]
+@cache(folder=cache_dir, max_value_bytes=1000)
+def sized(n):
+    calls.append(("sized", n))
+    return b"x" * n
+
+sized(10); sized(10)
+sized(10_000); sized(10_000)
+assert calls == [("sized", 10), ("sized", 10_000), ("sized", 10_000)], calls
+cool_cache.flush()
+pickles = [n for n in os.listdir(cache_dir) if n.endswith(".pickle")]
+with open(os.path.join(cache_dir, pickles[0]), "rb") as fh:
+    _, arg_hash_to_value = pickle.load(fh)
+assert len(arg_hash_to_value) == 1, arg_hash_to_value
+
+del calls[:]
+@cache(folder=None, adaptive_admission=True)
+def adaptive(x, delay):
+    calls.append(("adaptive", x))
+    if delay:
+        time.sleep(delay)
+    return x
+
+adaptive(1, 0); adaptive(1, 0)
+adaptive(2, 0.01); adaptive(2, 0.01)
+assert calls == [("adaptive", 1), ("adaptive", 1), ("adaptive", 2)], calls
+
+try:
+    cache(folder=None, min_compute_time="fast")
+except ValueError as error:
+    pass
+else:
+    raise AssertionError("expected a ValueError for a non-numeric min_compute_time")
+print("OK admission")
@@ -0,0 +1,81 @@
+"""Buffer-protocol arguments (numpy, bytearray, memoryview, array.array) are hashed from memory."""
+import array
+import sys
+from cool_cache import cache
+from cool_cache.__dependencies__.super_hash import super_hash
+
+assert super_hash(bytearray(b"abc")) == super_hash(bytearray(b"abc"))
+assert super_hash(bytearray(b"abc")) != super_hash(bytearray(b"abd"))
+# same bytes, different type/format => different hash
+assert super_hash(bytearray(b"abcd")) != super_hash(memoryview(b"abcd"))
+assert super_hash(array.array("i", [1, 2])) != super_hash(array.array("I", [1, 2]))
+super_hash(memoryview(b""))  # empty buffers are fine
+
+calls = []
+@cache(folder=None)
+def total(values):
+    calls.append(1)
+    return sum(values)
+
+assert total(array.array("d", [1.0, 2.0])) == 3.0
+assert total(array.array("d", [1.0, 2.0])) == 3.0
+assert len(calls) == 1
+
+# buffer arguments (and kwargs) are hashed from memory by @cache too, they're never pickled into the cache key
+pickled = []
+class RecordedBytes(bytearray):
+    def __reduce_ex__(self, protocol):
+        pickled.append(type(self).__name__)
+        return super().__reduce_ex__(protocol)
+
+@cache(folder=None)
+def length(values, more=b""):
+    calls.append(3)
+    return len(values) + len(more)
+
+del calls[:]
+assert length(RecordedBytes(b"abc"), more=RecordedBytes(b"de")) == 5
+assert length(RecordedBytes(b"abc"), more=RecordedBytes(b"de")) == 5
+assert length(RecordedBytes(b"abd"), more=RecordedBytes(b"de")) == 5
+assert calls == [3, 3] and pickled == [], (calls, pickled)
+
+try:
+    import numpy
+except ImportError:
+    print("OK buffer_hash (numpy not installed, skipped numpy checks)")
+    sys.exit(0)
+
+values = numpy.arange(100_000, dtype=numpy.float64)
+assert super_hash(values) == super_hash(values.copy())
+assert super_hash(values) != super_hash(values.astype(numpy.float32))
+# shape is part of the hash, layout (strides) is not
+grid = numpy.arange(12).reshape(3, 4)
+assert super_hash(grid) != super_hash(grid.reshape(4, 3))
+assert super_hash(grid) == super_hash(numpy.asfortranarray(grid))
+strided = numpy.arange(200_000, dtype=numpy.float64).reshape(-1, 2)[:, 0]
+assert super_hash(strided) == super_hash(numpy.ascontiguousarray(strided))
+modified = values.copy()
+modified[-1] += 1
+assert super_hash(values) != super_hash(modified)
+# dtypes that can't be exposed as a buffer still fall back to pickle
+super_hash(numpy.array([1, "a", None], dtype=object))
+super_hash(numpy.array(["2020-01-01"], dtype="datetime64[D]"))
+super_hash(numpy.zeros((0, 3)))
+
+@cache(folder=None)
+def mean(array_value):
+    calls.append(2)
+    return float(array_value.mean())
+
+class RecordedArray(numpy.ndarray):
+    def __reduce__(self):
+        pickled.append(type(self).__name__)
+        return super().__reduce__()
+
+del calls[:]
+mean(values); mean(values.copy()); mean(modified)
+assert calls == [2, 2], calls
+recorded = values.view(RecordedArray)
+mean(recorded); mean(recorded)
+assert calls == [2, 2, 2] and pickled == [], (calls, pickled)
+print("OK buffer_hash")
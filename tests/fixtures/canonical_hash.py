@@ -0,0 +1,61 @@
+"""Dicts, sets and frozensets hash the same regardless of insertion order or PYTHONHASHSEED."""
+import collections
+from cool_cache import cache
+from cool_cache.__dependencies__.super_hash import super_hash
+
+def callback(value):
+    return value + 1
+
+# insertion order doesn't matter (at any depth, and also when the container has to be walked)
+assert super_hash({"a": 1, "b": 2}) == super_hash({"b": 2, "a": 1})
+assert super_hash([{"a": {"x", "y"}}, 1]) == super_hash([{"a": {"y", "x"}}, 1])
+assert super_hash({"f": callback, "g": 1}) == super_hash({"g": 1, "f": callback})
+# but the contents and the type still do
+assert super_hash({"a": 1}) != super_hash({"a": 2})
+assert super_hash({1, 2}) != super_hash(frozenset({1, 2}))
+assert super_hash({1: 2}) != super_hash({(1, 2)})
+assert super_hash({"a": 1, "b": 2}) != super_hash([("a", 1), ("b", 2)])
+# keys of different types can't be sorted, those are sorted by the hash of each item instead
+assert super_hash({1: "a", "b": 2}) == super_hash({"b": 2, 1: "a"})
+assert super_hash([{(1, 2), (3, 4)}]) == super_hash([{(3, 4), (1, 2)}])
+# the same pickle is only worked out once, that shortcut has to give the same answer
+config = {"x": [1, 2], "y": {"z", "w"}}
+assert super_hash([config]) == super_hash([config]) == super_hash([{"y": {"w", "z"}, "x": [1, 2]}])
+# OrderedDict is about order, so it stays order-sensitive
+assert super_hash(collections.OrderedDict(a=1, b=2)) != super_hash(collections.OrderedDict(b=2, a=1))
+
+# cycles through a dict
+def build(first, second):
+    config = {}
+    config[first] = config
+    config[second] = [callback, {"c", "d"}]
+    return config
+assert super_hash(build("self", "other")) == super_hash(build("self", "other"))
+
+# deeply nested dicts don't hit the recursion limit
+deep = {}
+for _ in range(5_000):
+    deep = {"next": deep}
+super_hash(deep)
+
+# keyword arguments are a dict, so their order doesn't change the cache key
+calls = []
+@cache(folder=None)
+def combine(**kwargs):
+    calls.append(kwargs)
+    return sorted(kwargs)
+combine(a=1, b={"x", "y"})
+combine(b={"y", "x"}, a=1)
+assert len(calls) == 1, calls
+
+def make_checker():
+    # set literals are frozenset constants in the function's code
+    def is_fruit(value):
+        return value in {"apple", "banana", "cherry"}
+    return is_fruit
+
+# printed so the harness can check the hashes are the same in a process with a different PYTHONHASHSEED
+print(f"HASH {super_hash({'tags': {'red', 'green', 'blue'}, 'frozen': frozenset(['a', 'b', 'c'])})}")
+print(f"HASH {super_hash(build('self', 'other'))}")
+print(f"HASH {super_hash(make_checker())}")
+print("OK canonical_hash")
@@ -0,0 +1,94 @@
+"""watch_filepaths can return directories: Merkle hash, stat-unchanged files aren't re-read, include/exclude globs."""
+import os
+import shutil
+import sys
+import time
+import cool_cache
+from cool_cache import cache, settings, WatchedDirectory
+from cool_cache.__dependencies__.super_hash import hash_directory, hash_file
+
+cache_dir = sys.argv[1]
+shutil.rmtree(cache_dir, ignore_errors=True)
+data_dir = os.path.join(cache_dir, "dataset")
+an_hour_ago = time.time() - 3600
+
+def write(relative_path, content):
+    full_path = os.path.join(data_dir, relative_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    with open(full_path, "w") as the_file:
+        the_file.write(content)
+    os.utime(full_path, (an_hour_ago, an_hour_ago))
+
+for index in range(20):
+    write(f"part{index % 3}/rows_{index}.csv", f"{index}\n" * index)
+write("notes.txt", "not part of the dataset")
+write("tmp/scratch.csv", "excluded directory")
+
+reads = []
+original_hash_file = cool_cache.hash_file
+def counting_hash_file(filepath=None, **kwargs):
+    reads.append(filepath)
+    return original_hash_file(filepath, **kwargs)
+cool_cache.hash_file = counting_hash_file
+
+calls = []
+@cache(folder=None, watch_filepaths=lambda path: [WatchedDirectory(path, include="*.csv", exclude="tmp")])
+def row_count(path):
+    calls.append(1)
+    return sum(1 for _, _, files in os.walk(path) for _ in files)
+
+row_count(data_dir)
+assert (len(reads), len(calls)) == (20, 1), (len(reads), calls)
+# revalidating is a scandir walk, no file is read again
+del reads[:]
+row_count(data_dir)
+assert (len(reads), len(calls)) == (0, 1), (reads, calls)
+
+# excluded/not-included files don't matter
+write("tmp/other.csv", "excluded")
+write("notes.txt", "edited notes")
+write("readme.md", "new, not included")
+row_count(data_dir)
+assert (len(reads), len(calls)) == (0, 1), (reads, calls)
+
+# one edited file: one read, one recompute
+write("part1/rows_4.csv", "changed\n")
+row_count(data_dir)
+assert (len(reads), len(calls)) == (1, 2), (reads, calls)
+# added and renamed files change the hash
+write("part2/rows_extra.csv", "1\n")
+row_count(data_dir)
+os.rename(os.path.join(data_dir, "part2", "rows_extra.csv"), os.path.join(data_dir, "part2", "rows_renamed.csv"))
+row_count(data_dir)
+assert len(calls) == 4 and len(reads) == 3, (calls, reads)
+# removing it goes back to the earlier content: same Merkle hash, so it's a hit
+os.remove(os.path.join(data_dir, "part2", "rows_renamed.csv"))
+row_count(data_dir)
+assert len(calls) == 4 and len(reads) == 3, (calls, reads)
+
+# a plain directory path watches everything
+@cache(folder=None, watch_filepaths=lambda path: [path])
+def everything(path):
+    calls.append(2)
+    return True
+
+everything(data_dir); everything(data_dir)
+write("tmp/other.csv", "changed")
+everything(data_dir)
+assert calls.count(2) == 2, calls
+
+# hash_file works on folders too, the root's own name/location isn't part of the hash
+copy_dir = os.path.join(cache_dir, "copy")
+shutil.copytree(data_dir, copy_dir)
+assert hash_file(copy_dir) == hash_file(data_dir) == hash_directory(data_dir)
+assert hash_directory(data_dir, include="*.csv") != hash_directory(data_dir)
+assert hash_directory(data_dir, include="part1/*.csv") == hash_directory(copy_dir, include="part1/*.csv")
+assert hash_directory(data_dir, exclude=["tmp", "*.md", "*.txt"]) == hash_directory(data_dir, include="*.csv", exclude="tmp")
+
+# strict mode re-reads every file
+settings.file_hash_mode = "strict"
+del reads[:]
+row_count(data_dir)
+assert len(reads) == 20, len(reads)
+shutil.rmtree(cache_dir, ignore_errors=True)
+print("OK directory_watch")
@@ -0,0 +1,65 @@
+"""max_entries/max_bytes with lru and gdsf (GreedyDual-Size-Frequency) eviction."""
+import os
+import pickle
+import sys
+import time
+import cool_cache
+from cool_cache import cache
+
+cache_dir = sys.argv[1]
+calls = []
+
+@cache(folder=None, max_entries=2)
+def lru(x):
+    calls.append(x)
+    return x
+
+lru("a"); lru("b"); lru("a"); lru("c")  # "b" is the least recently used
+del calls[:]
+lru("a"); lru("c")
+assert calls == [], calls
+lru("b")
+assert calls == ["b"], calls
+assert lru.cache_info()["evictions"] == 2, lru.cache_info()
+
+# gdsf keeps the entry that is expensive to recompute, even though it was used least recently
+del calls[:]
+@cache(folder=cache_dir, max_entries=2, eviction="gdsf")
+def gdsf(x, delay):
+    calls.append(x)
+    time.sleep(delay)
+    return x
+
+gdsf("slow", 0.05); gdsf("fast1", 0); gdsf("fast2", 0); gdsf("fast3", 0)
+del calls[:]
+gdsf("slow", 0.05)
+assert calls == [], calls
+cool_cache.flush()
+pickles = [n for n in os.listdir(cache_dir) if n.endswith(".pickle")]
+with open(os.path.join(cache_dir, pickles[0]), "rb") as fh:
+    _, arg_hash_to_value = pickle.load(fh)
+assert len(arg_hash_to_value) == 2, arg_hash_to_value
+for entry in arg_hash_to_value.values():
+    assert entry.compute_seconds is not None and entry.value_bytes > 0
+
+# max_bytes bounds the total pickled size
+@cache(folder=None, max_bytes=3000)
+def sized(n):
+    return b"x" * n
+
+for index in range(10):
+    sized(1000 + index)
+assert sized.cache_info()["size"] == 2, sized.cache_info()
+
+# entries written before compute_seconds/value_bytes existed still load
+entry = cool_cache._CacheEntry.__new__(cool_cache._CacheEntry)
+entry.__setstate__((None, {"created_at": 1.0, "value": 2}))
+assert (entry.value, entry.compute_seconds, entry.value_bytes, entry.frequency) == (2, None, None, 1)
+
+try:
+    cache(folder=None, max_entries=2, eviction="fifo")
+except ValueError:
+    pass
+else:
+    raise AssertionError("expected a ValueError for an unknown eviction policy")
+print("OK eviction")
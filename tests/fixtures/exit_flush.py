@@ -0,0 +1,66 @@
+"""flush() + atexit: writes still waiting out the debounce window must reach disk."""
+import gc
+import os
+import sys
+import time
+import weakref
+import cool_cache
+from cool_cache import cache, settings
+
+cache_dir = sys.argv[1]
+mode = sys.argv[2]  # "first", "second", "interrupted" or "after_interrupt"
+
+# long enough that only flush()/atexit can get the writes out
+settings.flush_interval = 60
+
+real_calls = []
+
+@cache(folder=cache_dir)
+def triple(x):
+    real_calls.append(x)
+    return x * 3
+
+class SlowToPickle:
+    def __reduce__(self):
+        time.sleep(5)
+        return (int, (0,))
+
+@cache(folder=cache_dir)
+def slow(x):
+    real_calls.append(x)
+    return SlowToPickle() if x == 2 else x
+
+if mode == "first":
+    assert triple(1) == 3
+    assert cool_cache.flush(timeout=5) is True
+    assert [n for n in os.listdir(cache_dir) if n.endswith(".pickle")]
+    # once flushed, a dropped cached function (and its cache) isn't kept alive by the writer
+    class Result:
+        pass
+    def make_dropped():
+        def dropped():
+            return Result()
+        dropped = cache(folder=cache_dir)(dropped)
+        return weakref.ref(dropped())
+    result_reference = make_dropped()
+    assert cool_cache.flush(timeout=5) is True
+    gc.collect()
+    assert result_reference() is None
+    # this one is only written by the atexit flush
+    assert triple(2) == 6
+elif mode == "interrupted":
+    # the exit flush gives up on a write that outlasts its deadline, the cache file must keep what was already persisted
+    settings.exit_flush_timeout = 0.5
+    assert slow(1) == 1
+    assert cool_cache.flush(timeout=5) is True
+    slow(2)
+elif mode == "after_interrupt":
+    assert slow(1) == 1
+    assert real_calls == [], f"the interrupted write lost the entry that was already persisted: {real_calls}"
+elif mode == "second":
+    assert triple(1) == 3
+    assert triple(2) == 6
+    assert real_calls == [], f"expected atexit flush to persist, but recomputed: {real_calls}"
+else:
+    raise SystemExit(f"unknown mode {mode}")
+print(f"OK exit_flush mode={mode}")
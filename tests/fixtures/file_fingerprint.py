@@ -0,0 +1,100 @@
+"""watch_filepaths only re-reads a file when its stat fingerprint changes (unless settings.file_hash_mode = "strict")."""
+import os
+import shutil
+import sys
+import time
+import cool_cache
+from cool_cache import cache, settings
+
+cache_dir = sys.argv[1]
+shutil.rmtree(cache_dir, ignore_errors=True)
+os.makedirs(cache_dir)
+data_path = os.path.join(cache_dir, "data.txt")
+an_hour_ago = time.time() - 3600
+
+def write(content, mtime=an_hour_ago):
+    with open(data_path, "w") as the_file:
+        the_file.write(content)
+    os.utime(data_path, (mtime, mtime))
+
+reads = []
+original_hash_file = cool_cache.hash_file
+def counting_hash_file(filepath=None, **kwargs):
+    reads.append(filepath)
+    return original_hash_file(filepath, **kwargs)
+cool_cache.hash_file = counting_hash_file
+
+calls = []
+@cache(folder=None, watch_filepaths=lambda path: [path])
+def read(path):
+    calls.append(1)
+    with open(path) as the_file:
+        return the_file.read()
+
+write("hello")
+assert read(data_path) == "hello" and read(data_path) == "hello"
+assert (len(reads), len(calls)) == (1, 1), (reads, calls)
+
+# same size, same mtime, but the ctime (and usually inode) changes, so it's re-read
+time.sleep(0.01)
+write("howdy")
+assert read(data_path) == "howdy" and read(data_path) == "howdy"
+assert (len(reads), len(calls)) == (2, 2), (reads, calls)
+
+# a file modified within the last few seconds isn't trusted yet: every call re-reads
+write("fresh", mtime=time.time())
+read(data_path); read(data_path)
+assert len(reads) == 4 and len(calls) == 3, (reads, calls)
+
+# missing files still work
+assert len(cool_cache._compute_arg_hash((), {}, lambda: None, [], lambda: [os.path.join(cache_dir, "missing")], None, {})) > 0
+
+# strict mode always re-reads
+settings.file_hash_mode = "strict"
+del reads[:]
+read(data_path); read(data_path)
+assert len(reads) == 2, reads
+settings.file_hash_mode = "stat"
+
+# fingerprints can be saved for the next process
+write("saved")
+settings.file_fingerprint_file = os.path.join(cache_dir, "fingerprints", "files.pickle")
+del reads[:]
+read(data_path); read(data_path)
+assert len(reads) == 1, reads
+assert cool_cache.flush()
+assert os.path.isfile(settings.file_fingerprint_file)
+cool_cache._file_fingerprints.clear()
+cool_cache._file_fingerprints_loaded_from = None
+read(data_path)
+assert len(reads) == 1, reads
+
+# a fingerprint file that can't be written only warns, the caches themselves are still written
+import warnings
+cold_calls = []
+@cache(folder=os.path.join(cache_dir, "cold"), watch_filepaths=lambda path: [path])
+def cold_read(path):
+    cold_calls.append(1)
+    with open(path) as the_file:
+        return the_file.read()
+
+settings.file_fingerprint_file = cache_dir  # a (non-empty) directory
+cool_cache._file_fingerprints_dirty = True
+cold_read(data_path)
+with warnings.catch_warnings(record=True) as caught:
+    warnings.simplefilter("always")
+    assert cool_cache.flush(timeout=5) is True
+assert any("file fingerprints" in str(each.message) for each in caught), [str(each.message) for each in caught]
+assert [name for name in os.listdir(os.path.join(cache_dir, "cold")) if name.endswith(".pickle")]
+assert os.path.isfile(data_path)
+settings.file_fingerprint_file = None
+
+try:
+    settings.file_hash_mode = "sometimes"
+    read(data_path)
+except ValueError as error:
+    pass
+else:
+    raise AssertionError("expected ValueError for an unknown file_hash_mode")
+shutil.rmtree(cache_dir, ignore_errors=True)
+print("OK file_fingerprint")
@@ -0,0 +1,62 @@
+"""hash_file streams into one digest by default, and still produces the old chained hashes on request."""
+import io
+import os
+import shutil
+import sys
+from hashlib import md5
+import cool_cache
+from cool_cache import cache, settings
+from cool_cache.__dependencies__ import super_hash as super_hash_module
+from cool_cache.__dependencies__.super_hash import hash_file, file_exists_key
+
+cache_dir = sys.argv[1]
+shutil.rmtree(cache_dir, ignore_errors=True)
+os.makedirs(cache_dir)
+content = os.urandom(3 * 1024 * 1024 + 17)
+data_path = os.path.join(cache_dir, "data.bin")
+with open(data_path, "wb") as the_file:
+    the_file.write(content)
+
+# the chained format is exactly what older versions produced
+expected = file_exists_key
+for start in range(0, len(content), 1024):
+    expected = md5(bytes(expected, "utf-8") + content[start:start+1024]).hexdigest()
+assert hash_file(data_path, hash_format="chained") == expected
+assert hash_file(file=io.BytesIO(content), hash_format="chained") == expected
+
+# streaming: same hash for a path, an open file, a file-like object, and an mmap
+streamed = hash_file(data_path)
+assert streamed != expected
+with open(data_path, "rb") as the_file:
+    assert hash_file(file=the_file) == streamed
+assert hash_file(file=io.BytesIO(content)) == streamed
+super_hash_module._file_mmap_size = 1
+assert hash_file(data_path) == streamed
+super_hash_module._file_mmap_size = 8 << 20
+assert hash_file(file=io.BytesIO(content[:-1])) != streamed
+
+empty_path = os.path.join(cache_dir, "empty.bin")
+open(empty_path, "wb").close()
+assert hash_file(empty_path) == hash_file(file=io.BytesIO(b""))
+
+try:
+    hash_file(data_path, hash_format="fast")
+except ValueError as error:
+    pass
+else:
+    raise AssertionError("expected ValueError for an unknown hash_format")
+
+# cool_cache uses settings.file_hash_format for watched files
+settings.file_hash_mode = "strict"
+seen = []
+@cache(folder=None, watch_filepaths=lambda path: [path])
+def size(path):
+    seen.append(1)
+    return os.path.getsize(path)
+
+size(data_path); size(data_path)
+settings.file_hash_format = "chained"
+size(data_path); size(data_path)
+assert len(seen) == 2, seen
+shutil.rmtree(cache_dir, ignore_errors=True)
+print("OK file_hash_format")
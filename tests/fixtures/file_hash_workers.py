@@ -0,0 +1,65 @@
+"""settings.file_hash_workers hashes the watched paths on a thread pool, with the same result as hashing them in order."""
+import os
+import shutil
+import sys
+import threading
+import cool_cache
+from cool_cache import cache, settings
+
+cache_dir = sys.argv[1]
+shutil.rmtree(cache_dir, ignore_errors=True)
+os.makedirs(cache_dir)
+paths = []
+for index in range(8):
+    paths.append(os.path.join(cache_dir, f"input_{index}.bin"))
+    with open(paths[-1], "wb") as the_file:
+        the_file.write(bytes([index]) * (2 << 20))
+
+threads_used = set()
+original_hash_file = cool_cache.hash_file
+def recording_hash_file(filepath=None, **kwargs):
+    threads_used.add(threading.current_thread().name)
+    return original_hash_file(filepath, **kwargs)
+cool_cache.hash_file = recording_hash_file
+settings.file_hash_mode = "strict"
+
+sequential = cool_cache._hash_watched_files(paths)
+assert threads_used == { threading.current_thread().name }, threads_used
+
+settings.file_hash_workers = 4
+threads_used.clear()
+parallel = cool_cache._hash_watched_files(paths)
+assert parallel == sequential
+assert threads_used and all(each.startswith("cool_cache_file_hash") for each in threads_used), threads_used
+
+calls = []
+@cache(folder=None, watch_filepaths=lambda *paths: paths)
+def combine(*paths):
+    calls.append(1)
+    return len(paths)
+
+@cache(folder=cache_dir, watch_filepaths=lambda *paths: paths)
+def combine_cold(*paths):
+    calls.append(2)
+    return len(paths)
+
+for each_function in (combine, combine_cold):
+    each_function(*paths); each_function(*paths)
+    # order still matters
+    each_function(*reversed(paths))
+    # and so does the content
+    with open(paths[3], "ab") as the_file:
+        the_file.write(b"!")
+    each_function(*paths)
+assert calls == [1, 1, 1, 2, 2, 2], calls
+
+settings.file_hash_workers = 0
+try:
+    combine(*paths)
+except ValueError as error:
+    pass
+else:
+    raise AssertionError("expected ValueError for file_hash_workers = 0")
+cool_cache.worker_que.join()
+shutil.rmtree(cache_dir, ignore_errors=True)
+print("OK file_hash_workers")
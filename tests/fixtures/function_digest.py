@@ -0,0 +1,58 @@
+"""Function digests are reused by the next process until one of the function's source files changes."""
+import os
+import sys
+import time
+
+cache_dir, phase = sys.argv[1], sys.argv[2]
+source_dir = os.path.join(cache_dir, "source")
+an_hour_ago = time.time() - 3600
+
+def write_module(name, content):
+    module_path = os.path.join(source_dir, f"{name}.py")
+    with open(module_path, "w") as the_file:
+        the_file.write(content)
+    os.utime(module_path, (an_hour_ago, an_hour_ago))
+
+if phase == "setup":
+    os.makedirs(source_dir, exist_ok=True)
+    write_module("digest_helper", "def scale(value):\n    return value * 2\n")
+    write_module("digest_module", (
+        "from cool_cache import cache\n"
+        "from digest_helper import scale\n"
+        "calls = []\n"
+        f"@cache(folder={cache_dir!r})\n"
+        "def compute(value):\n"
+        "    calls.append(value)\n"
+        "    return scale(value) + 1\n"
+    ))
+    print("OK function_digest setup")
+    sys.exit(0)
+
+if phase == "edit_helper":
+    write_module("digest_helper", "def scale(value):\n    return value * 3\n")
+    print("OK function_digest edit_helper")
+    sys.exit(0)
+
+import cool_cache
+from cool_cache.__dependencies__.super_hash import function_hashers
+deep_calls = []
+original_deep = function_hashers.deep
+def counting_deep(*args, **kwargs):
+    deep_calls.append(args[0])
+    return original_deep(*args, **kwargs)
+function_hashers.deep = staticmethod(counting_deep)
+
+sys.path.insert(0, source_dir)
+import digest_module
+expected_deep_calls, expected_result, expected_calls = {
+    "compute":   (1, 7, [3]),
+    "reuse":     (0, 7, []),
+    "recompute": (1, 10, [3]),
+    "reuse_edited": (0, 10, []),
+}[phase]
+assert len(deep_calls) == expected_deep_calls, (phase, deep_calls)
+assert digest_module.compute(3) == expected_result
+assert digest_module.calls == expected_calls, (phase, digest_module.calls)
+assert cool_cache.flush()
+assert os.path.isfile(os.path.join(cache_dir, ".function_digests"))
+print(f"OK function_digest {phase}")
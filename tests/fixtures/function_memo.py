@@ -0,0 +1,120 @@
+"""Callables in arguments/depends_on are hashed once, and re-hashed when their code, closure, defaults or globals change."""
+import gc
+import sys
+from cool_cache import cache
+from cool_cache.__dependencies__.super_hash import super_hash, function_hashers, memo_info, record_source_files
+
+deep_calls = []
+original_deep = function_hashers.deep
+def counting_deep(input_func, *args, **kwargs):
+    deep_calls.append(getattr(input_func, "__name__", None))
+    return original_deep(input_func, *args, **kwargs)
+function_hashers.deep = staticmethod(counting_deep)
+
+def helper(value):
+    return value + 1
+
+def make_callback():
+    # nested functions can't be pickled, so they're hashed by function_hashers (module level functions pickle by name)
+    def callback(value):
+        return helper(value) * 2
+    return callback
+callback = make_callback()
+
+calls = []
+@cache(folder=None)
+def apply(function, value):
+    calls.append(value)
+    return function(value)
+
+for _ in range(100):
+    assert apply(callback, 3) == 8
+assert calls == [3] and deep_calls.count("callback") == 1, (calls, deep_calls)
+assert memo_info()["function"]["hits"] >= 99
+
+# the source files are still reported when the hash comes from the memo
+with record_source_files() as source_files:
+    super_hash(callback)
+assert __file__ in source_files, source_files
+
+# redefining a global the function uses
+original_hash = super_hash(callback)
+def helper(value):
+    return value + 2
+assert super_hash(callback) != original_hash
+assert apply(callback, 3) == 10 and calls == [3, 3], calls
+
+# reassigning __code__
+def make_other():
+    def other(value):
+        return helper(value) * 3
+    return other
+other = make_other()
+callback_hash = super_hash(callback)
+callback.__code__ = other.__code__.replace(co_name="callback")
+assert super_hash(callback) != callback_hash
+assert apply(callback, 3) == 15 and calls == [3, 3, 3], calls
+
+# reassigning the __code__ of a global the function uses
+callback_hash = super_hash(callback)
+helper.__code__ = (lambda value: value + 3).__code__
+assert super_hash(callback) != callback_hash
+assert super_hash(callback) == function_hashers.smart(callback)
+assert apply(callback, 3) == 18 and calls == [3, 3, 3, 3], calls
+
+# closures and defaults are part of the memo key
+def make_adder(amount):
+    def add(value, scale=1):
+        return (value + amount) * scale
+    return add
+adder = make_adder(1)
+super_hash(adder); super_hash(adder)
+assert deep_calls.count("add") == 1, deep_calls
+adder.__defaults__ = (2,)
+super_hash(adder)
+assert deep_calls.count("add") == 2, deep_calls
+
+# bound methods share their function's memo entry
+class Thing:
+    def method(self, value):
+        return value
+first, second = Thing(), Thing()
+assert super_hash(first.method) == super_hash(second.method) == super_hash(Thing.method)
+assert deep_calls.count("method") == 1, deep_calls
+
+# a recursive closure (its cell holds the function itself) isn't kept alive by the memo
+def make_countdown():
+    def countdown(value):
+        return value if value == 0 else countdown(value - 1)
+    return countdown
+size_before = memo_info()["function"]["size"]
+super_hash(make_countdown())
+gc.collect()
+assert memo_info()["function"]["size"] == size_before, memo_info()
+
+# a closure cell whose object was replaced by None is noticed (even though the old object is gone)
+def make_switchable():
+    target = Thing()
+    def switchable():
+        return target
+    def clear():
+        nonlocal target
+        target = None
+    return switchable, clear
+switchable, clear = make_switchable()
+super_hash(switchable)
+clear()
+gc.collect()
+super_hash(switchable)
+assert deep_calls.count("switchable") == 2, deep_calls
+
+# depends_on output goes through the same memo
+@cache(folder=None, depends_on=lambda: callback)
+def constant():
+    calls.append("constant")
+    return 1
+before = deep_calls.count("callback")
+for _ in range(50):
+    constant()
+assert deep_calls.count("callback") == before, deep_calls
+print("OK function_memo")
@@ -0,0 +1,68 @@
+"""settings.hash_algorithm: blake2b/blake2s/xxhash, recorded so switching never mixes key spaces."""
+import sys
+import cool_cache
+from cool_cache import cache, settings
+from cool_cache.__dependencies__.super_hash import super_hash, get_hash_algorithm
+
+cache_dir = sys.argv[1]
+algorithm = sys.argv[2]
+expect_recompute = sys.argv[3] == "recompute"
+
+if sys.argv[3] == "switch":
+    # changing settings.hash_algorithm after decorating moves the function to that algorithm's cache file
+    import os
+    switch_dir = os.path.join(cache_dir, "switch")
+    switch_calls = []
+    settings.hash_algorithm = "md5"
+    @cache(folder=switch_dir)
+    def triple(x):
+        switch_calls.append(x)
+        return x * 3
+    assert triple(1) == 3
+    settings.hash_algorithm = algorithm
+    assert triple(1) == 3 and triple(2) == 6 and switch_calls == [1, 1, 2], switch_calls
+    settings.hash_algorithm = "md5"
+    assert triple(1) == 3 and switch_calls == [1, 1, 2], switch_calls
+    assert cool_cache.flush()
+    entry_counts = {}
+    for name in os.listdir(switch_dir):
+        if name.endswith(".pickle"):
+            with open(os.path.join(switch_dir, name), "rb") as the_file:
+                deep_hash, entries = cool_cache.get_pickle().load(the_file)
+            entry_counts[deep_hash.startswith(algorithm)] = len(entries)
+    assert entry_counts == { False: 1, True: 2 }, entry_counts
+    print(f"OK hash_algorithm switch {algorithm}")
+    sys.exit(0)
+
+settings.hash_algorithm = algorithm
+real_calls = []
+
+@cache(folder=cache_dir)
+def double(x):
+    real_calls.append(x)
+    return x * 2
+
+assert double(21) == 42
+assert double(21) == 42
+cool_cache.flush()
+if expect_recompute:
+    assert real_calls == [21], real_calls
+else:
+    assert real_calls == [], real_calls
+
+if algorithm == "blake2b":
+    assert get_hash_algorithm() == "blake2b-16"
+    assert len(super_hash([1, 2, 3])) == 32
+    settings.hash_digest_size = 32
+    double(1)
+    assert get_hash_algorithm() == "blake2b-32"
+    assert len(super_hash([1, 2, 3])) == 64
+
+try:
+    settings.hash_algorithm, settings.hash_digest_size = "sha-nope", None
+    cache(folder=None)
+except ValueError:
+    pass
+else:
+    raise AssertionError("expected a ValueError for an unknown hash algorithm")
+print(f"OK hash_algorithm {algorithm}")
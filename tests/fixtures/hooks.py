@@ -0,0 +1,50 @@
+"""settings.hooks + cache(on_event=...): structured events for each cache phase."""
+import os
+import sys
+import time
+import cool_cache
+from cool_cache import cache, settings
+
+cache_dir = sys.argv[1]
+
+global_events = []
+local_events = []
+settings.hooks.append(lambda event: global_events.append(event))
+
+@cache(folder=None, keep_for="30ms", on_event=local_events.append)
+def in_ram(x):
+    return x
+
+in_ram(1); in_ram(1)
+time.sleep(0.08)
+in_ram(1)
+kinds = [ each.kind for each in local_events ]
+assert kinds == ["lookup", "miss", "compute", "lookup", "hit", "lookup", "expiry", "compute"], kinds
+assert [ each.kind for each in global_events ] == kinds
+assert all(each.function_name == "__main__.in_ram" for each in local_events)
+assert local_events[2].seconds is not None and local_events[0].arg_hash is not None
+
+# a corrupt file on disk must be reported before being removed
+@cache(folder=cache_dir, on_event=local_events.append)
+def on_disk(x):
+    return x
+
+manager = list(cool_cache.all_function_cache_managers.values())[-1]
+os.makedirs(cache_dir, exist_ok=True)
+with open(manager.cache_file_name, "wb") as fh:
+    fh.write(b"not a pickle")
+
+del local_events[:]
+on_disk(1)
+cool_cache.flush()
+kinds = [ each.kind for each in local_events ]
+assert kinds == ["corruption_removal", "file_load", "lookup", "miss", "compute", "enqueue", "file_write"], kinds
+assert local_events[-1].cache_file_name == manager.cache_file_name
+
+# a hook that raises must not break the cached function
+settings.hooks.append(lambda event: 1/0)
+import warnings
+with warnings.catch_warnings(record=True):
+    warnings.simplefilter("always")
+    assert on_disk(2) == 2
+print("OK hooks")
@@ -0,0 +1,76 @@
+"""Frozen / versioned objects are hashed once per object (and version), and forgotten when garbage collected."""
+import gc
+from cool_cache import cache
+from cool_cache.__dependencies__ import super_hash as super_hash_module
+from cool_cache.__dependencies__.super_hash import super_hash, is_memoizable, frozen_types, set_hash_algorithm
+
+computed = []
+original_super_hash = super_hash_module._super_hash
+def counting_super_hash(value, already_seen):
+    computed.append(type(value).__name__)
+    return original_super_hash(value, already_seen)
+super_hash_module._super_hash = counting_super_hash
+
+class LookupTable(dict):
+    __super_hash_frozen__ = True
+
+table = LookupTable({ index: str(index) for index in range(50_000) })
+first = super_hash(table)
+assert super_hash(table) == first and super_hash([table, table]) != first
+assert computed.count("LookupTable") == 1, computed
+# equal content, different object: hashed separately, same result
+assert super_hash(LookupTable(table)) == first
+assert computed.count("LookupTable") == 2, computed
+
+# mutable objects opt in with a version that changes on every mutation
+class Registry:
+    def __init__(self):
+        self.items = []
+        self.version = 0
+    def add(self, item):
+        self.items.append(item)
+        self.version += 1
+    def __super_hash_version__(self):
+        return self.version
+
+registry = Registry()
+before = super_hash(registry)
+assert super_hash(registry) == before and computed.count("Registry") == 1
+registry.add("x")
+after = super_hash(registry)
+assert after != before and computed.count("Registry") == 2
+
+# classes that can't be edited can be registered, objects without weakref support aren't memoized
+class Plain(dict):
+    pass
+class Slotted:
+    __slots__ = ("value",)
+    __super_hash_frozen__ = True
+assert not is_memoizable(Plain())
+frozen_types.add(Plain)
+assert is_memoizable(Plain()) and not is_memoizable(Slotted()) and not is_memoizable({})
+
+# the memo is keyed by hash algorithm too
+set_hash_algorithm("blake2b")
+assert super_hash(table) != first
+set_hash_algorithm("md5")
+assert super_hash(table) == first
+
+# garbage collected objects are dropped from the memo
+memo_size = len(super_hash_module._identity_memo)
+super_hash(LookupTable({ "temporary": 1 }))
+gc.collect()
+assert len(super_hash_module._identity_memo) == memo_size
+
+# cached functions don't re-hash (or pickle) the table on every call
+calls = []
+@cache(folder=None)
+def lookup(table, key):
+    calls.append(key)
+    return table[key]
+
+del computed[:]
+for _ in range(100):
+    assert lookup(table, 7) == "7"
+assert calls == [7] and computed.count("LookupTable") == 0, (calls, computed)
+print("OK identity_memo")
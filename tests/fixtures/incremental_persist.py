@@ -0,0 +1,38 @@
+"""Dirty-key persistence: the writer merges new keys into what's already on disk."""
+import os
+import pickle
+import sys
+import cool_cache
+from cool_cache import cache
+
+cache_dir = sys.argv[1]
+mode = sys.argv[2]  # "first" or "second"
+
+real_calls = []
+
+@cache(folder=cache_dir)
+def square(x):
+    real_calls.append(x)
+    return x * x
+
+def persisted_keys():
+    pickles = [n for n in os.listdir(cache_dir) if n.endswith(".pickle")]
+    assert len(pickles) == 1, pickles
+    with open(os.path.join(cache_dir, pickles[0]), "rb") as fh:
+        _, arg_hash_to_value = pickle.load(fh)
+    return arg_hash_to_value
+
+if mode == "first":
+    for i in range(50):
+        assert square(i) == i * i
+    cool_cache.worker_que.join()
+    assert len(persisted_keys()) == 50, len(persisted_keys())
+elif mode == "second":
+    for i in range(55):
+        assert square(i) == i * i
+    cool_cache.worker_que.join()
+    assert real_calls == list(range(50, 55)), real_calls
+    assert len(persisted_keys()) == 55, len(persisted_keys())
+else:
+    raise SystemExit(f"unknown mode {mode}")
+print(f"OK incremental_persist mode={mode}")
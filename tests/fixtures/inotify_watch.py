@@ -0,0 +1,103 @@
+"""settings.file_hash_mode = "inotify": unchanged watched files aren't touched at all, changes reported by the kernel re-hash them."""
+import os
+import shutil
+import sys
+import time
+import cool_cache
+from cool_cache import cache, settings
+
+cache_dir = sys.argv[1]
+shutil.rmtree(cache_dir, ignore_errors=True)
+os.makedirs(cache_dir)
+config_path = os.path.join(cache_dir, "config.ini")
+an_hour_ago = time.time() - 3600
+
+def write(content, path=config_path):
+    with open(path, "w") as the_file:
+        the_file.write(content)
+    os.utime(path, (an_hour_ago, an_hour_ago))
+
+reads = []
+stats = []
+original_hash_file = cool_cache.hash_file
+original_fingerprinted_file_hash = cool_cache._fingerprinted_file_hash
+def counting_hash_file(filepath=None, **kwargs):
+    reads.append(filepath)
+    return original_hash_file(filepath, **kwargs)
+def counting_fingerprinted_file_hash(filepath, stat_result, hash_format):
+    stats.append(filepath)
+    return original_fingerprinted_file_hash(filepath, stat_result, hash_format)
+cool_cache.hash_file = counting_hash_file
+cool_cache._fingerprinted_file_hash = counting_fingerprinted_file_hash
+
+settings.file_hash_mode = "inotify"
+calls = []
+@cache(folder=None, watch_filepaths=lambda path: [path])
+def read(path):
+    calls.append(1)
+    with open(path) as the_file:
+        return the_file.read()
+
+write("a=1")
+if not cool_cache._get_inotify_watcher():
+    # not linux (or no inotify): behaves exactly like "stat"
+    read(config_path); read(config_path)
+    assert (len(reads), len(calls)) == (1, 1), (reads, calls)
+    print("OK inotify_watch (inotify not available, checked the stat fallback)")
+    sys.exit(0)
+
+assert read(config_path) == "a=1"
+for _ in range(100):
+    assert read(config_path) == "a=1"
+assert (len(stats), len(reads), len(calls)) == (1, 1, 1), (stats, reads, calls)
+
+# a write the stat fingerprint could miss (same size, same mtime) still gets reported
+write("a=2")
+assert read(config_path) == "a=2" and read(config_path) == "a=2"
+assert (len(reads), len(calls)) == (2, 2), (reads, calls)
+
+# atomically replaced (new inode)
+write("a=3", config_path + ".new")
+os.replace(config_path + ".new", config_path)
+assert read(config_path) == "a=3" and read(config_path) == "a=3"
+assert len(calls) == 3, calls
+
+# deleted, then created again
+os.remove(config_path)
+try:
+    read(config_path)
+except FileNotFoundError as error:
+    pass
+write("a=4")
+assert read(config_path) == "a=4" and read(config_path) == "a=4"
+assert len(calls) == 5, calls
+
+# changes made in between calls to other watched files aren't mixed up
+other_path = os.path.abspath(os.path.join(cache_dir, "other.ini"))
+write("b=1", other_path)
+read(other_path); read(config_path)
+write("b=2", other_path)
+del stats[:]
+read(config_path); read(other_path)
+assert stats == [other_path], stats
+assert read(other_path) == "b=2"
+
+# the directory holding it is swapped out for another one
+data_dir = os.path.abspath(os.path.join(cache_dir, "data"))
+data_path = os.path.join(data_dir, "cfg.txt")
+os.makedirs(data_dir)
+os.makedirs(data_dir + "_new")
+write("c=1", data_path)
+write("c=2", os.path.join(data_dir + "_new", "cfg.txt"))
+assert read(data_path) == "c=1" and read(data_path) == "c=1"
+os.rename(data_dir, data_dir + "_old")
+os.rename(data_dir + "_new", data_dir)
+assert read(data_path) == "c=2"
+
+# the fallback is the stat fingerprint
+cool_cache._inotify_watcher = False
+del reads[:]
+read(config_path); read(config_path)
+assert len(reads) == 0, reads
+shutil.rmtree(cache_dir, ignore_errors=True)
+print("OK inotify_watch")
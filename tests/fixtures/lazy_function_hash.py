@@ -0,0 +1,55 @@
+"""settings.lazy_function_hash: the function hash, cache file, and bust=True happen on the first call, once."""
+import os
+import shutil
+import sys
+import threading
+import cool_cache
+from cool_cache import cache, settings
+from cool_cache.__dependencies__.super_hash import function_hashers
+
+cache_dir, phase = sys.argv[1], sys.argv[2]
+if phase == "first":
+    shutil.rmtree(cache_dir, ignore_errors=True)
+settings.lazy_function_hash = True
+settings.persist_function_digests = False
+
+deep_calls = []
+original_deep = function_hashers.deep
+def counting_deep(input_func, *args, **kwargs):
+    deep_calls.append(getattr(input_func, "__name__", None))
+    return original_deep(input_func, *args, **kwargs)
+function_hashers.deep = staticmethod(counting_deep)
+
+calls = []
+@cache(folder=cache_dir)
+def used(value):
+    calls.append(value)
+    return value * 2
+
+@cache(folder=cache_dir, bust=True)
+def busted(value):
+    calls.append(-value)
+    return value
+
+@cache(folder=cache_dir)
+def never_called(value):
+    return value
+
+assert deep_calls == [], deep_calls
+
+threads = [ threading.Thread(target=used, args=(1,)) for _ in range(8) ]
+for each in threads: each.start()
+for each in threads: each.join()
+assert deep_calls.count("used") == 1, deep_calls
+assert used(1) == 2 and busted(5) == 5 and busted(5) == 5
+assert "never_called" not in deep_calls, deep_calls
+cool_cache.flush()
+
+pickles = [ name for name in os.listdir(cache_dir) if name.endswith(".pickle") ]
+assert len(pickles) == 2, pickles
+if phase == "first":
+    assert calls.count(1) >= 1 and calls.count(-5) == 1, calls
+else:
+    # used() was loaded from disk, busted() was busted (lazily) before loading
+    assert 1 not in calls and calls.count(-5) == 1, calls
+print(f"OK lazy_function_hash {phase}")
@@ -0,0 +1,50 @@
+"""cache_info() / cool_cache.stats(): hits, misses, expired and per-phase timings."""
+import gc
+import sys
+import time
+import weakref
+import cool_cache
+from cool_cache import cache
+
+cache_dir = sys.argv[1]
+
+@cache(folder=None, keep_for="30ms")
+def in_ram(x):
+    return x * 2
+
+@cache(folder=cache_dir)
+def on_disk(x):
+    time.sleep(0.01)
+    return x * 3
+
+in_ram(1); in_ram(1); in_ram(2)
+time.sleep(0.08)
+in_ram(1)
+info = in_ram.cache_info()
+assert (info["hits"], info["misses"], info["expired"]) == (1, 3, 1), info
+assert info["size"] == 2, info
+assert set(info["seconds"]) == set(cool_cache.CacheStats.phases), info
+
+on_disk(1); on_disk(1); on_disk(1)
+cool_cache.flush()
+info = on_disk.cache_info()
+assert (info["hits"], info["misses"], info["expired"]) == (2, 1, 0), info
+assert info["seconds"]["input_func"] >= 0.01, info
+assert info["seconds"]["super_hash"] > 0, info
+assert info["seconds"]["persist"] > 0, info
+
+names = [ each["name"] for each in cool_cache.stats() ]
+assert "__main__.in_ram" in names and "__main__.on_disk" in names, names
+# stats() doesn't keep a dropped cached function (or its in-memory cache) alive
+class Result:
+    pass
+def make_dropped():
+    @cache(folder=None)
+    def dropped():
+        return Result()
+    return weakref.ref(dropped())
+result_reference = make_dropped()
+gc.collect()
+assert result_reference() is None
+assert "__main__.make_dropped.<locals>.dropped" not in [ each["name"] for each in cool_cache.stats() ]
+print("OK metrics")
@@ -0,0 +1,41 @@
+"""super_hash's memo of non-iterable values is keyed by identity, dies with its objects, and is bounded."""
+import gc
+import threading
+from cool_cache.__dependencies__.super_hash import super_hash, memo_info
+
+def non_iterable_info():
+    return memo_info()["non_iterable"]
+
+# weakref-able values are forgotten when they die (no stale entry for a reused id)
+baseline = non_iterable_info()["size"]
+locks = [ threading.Lock() for _ in range(500) ]
+hashes = [ super_hash(each) for each in locks ]
+assert non_iterable_info()["size"] == baseline + 500, non_iterable_info()
+hits = non_iterable_info()["hits"]
+assert [ super_hash(each) for each in locks ] == hashes
+assert non_iterable_info()["hits"] == hits + 500, non_iterable_info()
+del locks, hashes
+gc.collect()
+assert non_iterable_info()["size"] == baseline, non_iterable_info()
+for _ in range(500):
+    super_hash(threading.Lock())
+gc.collect()
+assert non_iterable_info()["size"] == baseline, non_iterable_info()
+
+# values that can't be weakref-ed are held in a bounded LRU (which also keeps their id from being reused)
+class NoWeakref:
+    __slots__ = ()
+    def __reduce__(self):
+        raise TypeError("not picklable")
+
+super_hash._non_iterable_cache.max_strong_entries = 8
+kept = [ NoWeakref() for _ in range(20) ]
+first_hashes = [ super_hash(each) for each in kept ]
+info = non_iterable_info()
+assert (info["strong_entries"], info["evictions"]) == (8, 12), info
+# the newest ones are still memoized, the evicted ones are recomputed (with the same result while they're alive)
+assert [ super_hash(each) for each in kept ] == first_hashes
+assert non_iterable_info()["strong_entries"] == 8
+
+assert set(memo_info()) == { "non_iterable", "identity", "function" }
+print("OK non_iterable_memo")
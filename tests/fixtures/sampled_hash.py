@@ -0,0 +1,68 @@
+"""hash_mode="sampled": only the named types are sampled, with a warning, and changes outside the sample go unnoticed."""
+import warnings
+from cool_cache import cache
+
+calls = []
+with warnings.catch_warnings(record=True) as caught:
+    warnings.simplefilter("always")
+    @cache(folder=None, hash_mode="sampled", sample_types=bytearray, sample_bytes=64 * 1024)
+    def size_of(data, label=None):
+        calls.append(label)
+        return len(data)
+assert len(caught) == 1 and "NOT bust the cache" in str(caught[0].message), [str(each.message) for each in caught]
+
+for bad_arguments in [ dict(hash_mode="sampled"), dict(hash_mode="sampled", sample_types=bytearray, sample_bytes=0), dict(hash_mode="partial") ]:
+    try:
+        cache(folder=None, **bad_arguments)
+    except ValueError as error:
+        pass
+    else:
+        raise AssertionError(f"expected ValueError for {bad_arguments}")
+
+data = bytearray(10_000_000)
+size_of(data); size_of(data)
+assert calls == [None], calls
+
+# the tradeoff: one byte changed between the sampled blocks is not noticed
+data[len(data) // 2 + 7000] = 1
+size_of(data)
+assert calls == [None], calls
+
+# the head, the tail, and the size always are
+data[0] = 1
+size_of(data)
+data[-1] = 1
+size_of(data)
+size_of(data[:-1])
+assert calls == [None, None, None, None], calls
+
+# keyword arguments get sampled too, and other types are still hashed fully
+size_of(data=data)
+size_of(data, label=bytes(data))
+size_of(data, label=bytes(data[:-1]))
+assert calls == [None, None, None, None, None, bytes(data), bytes(data[:-1])], len(calls)
+
+# small buffers are hashed fully
+small = bytearray(1000)
+size_of(small); small[500] = 1; size_of(small)
+assert len(calls) == 9, len(calls)
+
+try:
+    import numpy
+except ImportError:
+    print("OK sampled_hash (numpy not installed, skipped numpy checks)")
+    raise SystemExit(0)
+
+with warnings.catch_warnings():
+    warnings.simplefilter("ignore")
+    @cache(folder=None, hash_mode="sampled", sample_types=(numpy.ndarray,), sample_bytes=256 * 1024)
+    def total(array):
+        calls.append("total")
+        return float(array.sum())
+
+del calls[:]
+values = numpy.arange(4_000_000, dtype=numpy.float64).reshape(2000, 2000)
+total(values); total(numpy.asfortranarray(values)); total(values.copy())
+total(values.astype(numpy.float32)); total(values.reshape(4000, 1000))
+assert calls == ["total"] * 3, calls
+print("OK sampled_hash")
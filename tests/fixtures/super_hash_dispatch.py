@@ -0,0 +1,37 @@
+"""super_hash's per-type dispatch cache: resolved once per type, invalidated when conversion_table changes."""
+from cool_cache.__dependencies__.super_hash import super_hash
+
+class Thing:
+    def __init__(self, size):
+        self.size = size
+
+before = super_hash([Thing(1)])
+
+# adding an entry after a type was already resolved must take effect
+super_hash.conversion_table[Thing] = lambda value: super_hash(("Thing", value.size))
+assert super_hash(Thing(1)) == super_hash(("Thing", 1))
+assert super_hash(Thing(1)) != super_hash(Thing(2))
+
+# value-dependent predicates are still checked against every value
+is_big = lambda value: isinstance(value, Thing) and value.size > 10
+super_hash.conversion_table[is_big] = lambda value: "big"
+assert super_hash(Thing(11)) == "big"
+assert super_hash(Thing(1)) == super_hash(("Thing", 1))
+
+# predicates that promise to only look at the type are evaluated once per type
+predicate_calls = []
+def is_thing(value):
+    predicate_calls.append(value)
+    return isinstance(value, Thing)
+is_thing.depends_only_on_type = True
+super_hash.conversion_table[is_thing] = lambda value: "thing"
+for size in range(100):
+    assert super_hash(Thing(size)) == "thing"
+assert len(predicate_calls) == 1, len(predicate_calls)
+
+# removing entries invalidates too
+del super_hash.conversion_table[is_thing]
+del super_hash.conversion_table[is_big]
+del super_hash.conversion_table[Thing]
+assert super_hash(Thing(11)) != "big"
+print("OK super_hash_dispatch")
@@ -0,0 +1,31 @@
+"""super_hash's streaming encoder for containers that pickle can't handle."""
+from cool_cache.__dependencies__.super_hash import super_hash
+
+def callback(value):
+    return value + 1
+
+def build():
+    config = {"name": "run", "layers": [64, 32, (1.5, None, True)], "callback": callback}
+    config["self"] = config  # cycle
+    return config
+
+# equal structures hash equal, including through a cycle
+assert super_hash(build()) == super_hash(build())
+
+# small differences anywhere change the hash
+assert super_hash([callback, 1]) != super_hash([callback, 2])
+assert super_hash([callback, [1]]) != super_hash([callback, (1,)])
+assert super_hash([callback, "1"]) != super_hash([callback, 1])
+assert super_hash([callback, 1]) != super_hash([callback, 1.0])
+assert super_hash({"x": callback}) != super_hash({"y": callback})
+assert super_hash([callback, [1, 2], [3]]) != super_hash([callback, [1], [2, 3]])
+
+# deep nesting doesn't hit the recursion limit
+deep = [callback]
+for _ in range(10_000):
+    deep = [deep]
+super_hash(deep)
+
+# printed so the harness can check the hash is the same in another process
+print(f"HASH {super_hash(build())}")
+print("OK super_hash_streaming")
@@ -33,4 +33,41 @@ u.b = 42
 assert u.work(0) == first_u
 u.a = 9
 assert u.work(0) != first_u
+
+# frozen/versioned self: the attributes are read off self itself, not off its memoized hash
+class FrozenConfig:
+    __super_hash_frozen__ = True
+    def __init__(self, x):
+        self.x = x
+
+    @cache(folder=None, watch_attributes=["x"])
+    def get(self, y):
+        return self.x * y
+
+    @cache(folder=None, watch_attributes=lambda self: self.x)
+    def get_callable(self, y):
+        return self.x * y
+
+assert FrozenConfig(1).get(10) == 10 and FrozenConfig(2).get(10) == 20
+assert FrozenConfig(1).get_callable(10) == 10 and FrozenConfig(2).get_callable(10) == 20
+
+class VersionedConfig:
+    def __init__(self, x):
+        self.x = x
+        self.version = 0
+    def __super_hash_version__(self):
+        return self.version
+
+    @cache(folder=None, watch_attributes=["x"])
+    def get(self, y):
+        return self.x * y
+
+    @cache(folder=None, watch_attributes=lambda self: self.x)
+    def get_callable(self, y):
+        return self.x * y
+
+config = VersionedConfig(3)
+assert config.get(10) == 30 and config.get_callable(10) == 30
+config.x = 4  # version not bumped, but x is watched
+assert config.get(10) == 40 and config.get_callable(10) == 40
 print("OK watch_attributes")
@@ -0,0 +1,50 @@
+"""settings.writer_threads: several writer threads, each cache file still persisted."""
+import os
+import sys
+import cool_cache
+from cool_cache import cache, settings
+
+cache_dir = sys.argv[1]
+mode = sys.argv[2]  # "first" or "second"
+
+settings.writer_threads = 4
+settings.flush_interval = 0
+
+real_calls = []
+
+@cache(folder=cache_dir)
+def f1(x):
+    real_calls.append(("f1", x))
+    return x + 1
+
+@cache(folder=cache_dir)
+def f2(x):
+    real_calls.append(("f2", x))
+    return x + 2
+
+@cache(folder=cache_dir)
+def f3(x):
+    real_calls.append(("f3", x))
+    return x + 3
+
+@cache(folder=cache_dir)
+def f4(x):
+    real_calls.append(("f4", x))
+    return x + 4
+
+assert len(cool_cache.worker_que.threads) == 4
+for i in range(25):
+    for offset, each in enumerate((f1, f2, f3, f4), start=1):
+        assert each(i) == i + offset
+cool_cache.worker_que.join()
+
+pickles = [n for n in os.listdir(cache_dir) if n.endswith(".pickle")]
+assert len(pickles) == 4, pickles
+
+if mode == "first":
+    assert len(real_calls) == 100, len(real_calls)
+elif mode == "second":
+    assert real_calls == [], real_calls
+else:
+    raise SystemExit(f"unknown mode {mode}")
+print(f"OK writer_pool mode={mode}")
@@ -18,6 +18,7 @@ Run via: PYTHONPATH=main python3 tests/test_integration.py
      or: ./run/test_integration
 """
 
+import json
 import os
 import shutil
 import subprocess
@@ -138,6 +139,214 @@ def t_cross_function():
         shutil.rmtree(d, ignore_errors=True)
 
 
+@test("writer merges dirty keys into the persisted file")
+def t_incremental_persist():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("incremental_persist.py", d, "first"))
+        assert_success(run_fixture("incremental_persist.py", d, "second"))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("flush() and interpreter exit persist debounced writes")
+def t_exit_flush():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("exit_flush.py", d, "first"))
+        assert_success(run_fixture("exit_flush.py", d, "second"))
+        assert_success(run_fixture("exit_flush.py", d, "interrupted"))
+        assert_success(run_fixture("exit_flush.py", d, "after_interrupt"))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("writer pool persists every function's cache file")
+def t_writer_pool():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("writer_pool.py", d, "first"))
+        assert_success(run_fixture("writer_pool.py", d, "second"))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("cache_info() and stats() count hits, misses and phase timings")
+def t_metrics():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("metrics.py", d))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("hooks receive lookup/hit/miss/load/write events")
+def t_hooks():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("hooks.py", d))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("admission policies skip cheap or oversized results")
+def t_admission():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("admission.py", d))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("bounded caches evict with lru and gdsf")
+def t_eviction():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("eviction.py", d))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("super_hash dispatch cache follows conversion_table changes")
+def t_super_hash_dispatch():
+    assert_success(run_fixture("super_hash_dispatch.py"))
+
+
+@test("super_hash streams unpicklable containers, same hash across processes")
+def t_super_hash_streaming():
+    first = run_fixture("super_hash_streaming.py")
+    second = run_fixture("super_hash_streaming.py")
+    assert_success(first)
+    assert_success(second)
+    first_hash = [line for line in first.stdout.splitlines() if line.startswith("HASH")]
+    second_hash = [line for line in second.stdout.splitlines() if line.startswith("HASH")]
+    assert first_hash == second_hash, (first_hash, second_hash)
+
+
+@test("switching settings.hash_algorithm invalidates instead of mixing keys")
+def t_hash_algorithm():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("hash_algorithm.py", d, "md5", "recompute"))
+        assert_success(run_fixture("hash_algorithm.py", d, "md5", "hit"))
+        assert_success(run_fixture("hash_algorithm.py", d, "blake2b", "recompute"))
+        assert_success(run_fixture("hash_algorithm.py", d, "blake2b", "hit"))
+        assert_success(run_fixture("hash_algorithm.py", d, "blake2s", "recompute"))
+        assert_success(run_fixture("hash_algorithm.py", d, "blake2b", "switch"))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("numpy/bytearray/array arguments are hashed from their buffer")
+def t_buffer_hash():
+    assert_success(run_fixture("buffer_hash.py"))
+
+
+@test("hash_mode=\"sampled\" only samples the named types")
+def t_sampled_hash():
+    assert_success(run_fixture("sampled_hash.py"))
+
+
+@test("watched files are only re-read when their stat fingerprint changes")
+def t_file_fingerprint():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("file_fingerprint.py", d))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("hash_file streams by default and keeps the chained format for compatibility")
+def t_file_hash_format():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("file_hash_format.py", d))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("watch_filepaths can watch directories (Merkle hash + include/exclude)")
+def t_directory_watch():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("directory_watch.py", d))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("settings.file_hash_workers hashes watched files in parallel")
+def t_file_hash_workers():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("file_hash_workers.py", d))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("settings.file_hash_mode = \"inotify\" only re-hashes files the kernel reports as changed")
+def t_inotify_watch():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("inotify_watch.py", d))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("frozen/versioned arguments are hashed once per object")
+def t_identity_memo():
+    assert_success(run_fixture("identity_memo.py"))
+
+
+@test("super_hash's non-iterable memo is identity-safe and bounded")
+def t_non_iterable_memo():
+    assert_success(run_fixture("non_iterable_memo.py"))
+
+
+@test("function digests are reused between processes until their source changes")
+def t_function_digest():
+    d = fresh_dir()
+    try:
+        for phase in ("setup", "compute", "reuse", "edit_helper", "recompute", "reuse_edited"):
+            assert_success(run_fixture("function_digest.py", d, phase))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("settings.lazy_function_hash defers the function hash to the first call")
+def t_lazy_function_hash():
+    d = fresh_dir()
+    try:
+        assert_success(run_fixture("lazy_function_hash.py", d, "first"))
+        assert_success(run_fixture("lazy_function_hash.py", d, "second"))
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("callables in arguments are hashed once until their code/closure/defaults/globals change")
+def t_function_memo():
+    assert_success(run_fixture("function_memo.py"))
+
+
+@test("dicts/sets hash the same in processes with different PYTHONHASHSEEDs")
+def t_canonical_hash():
+    original_seed = os.environ.get("PYTHONHASHSEED")
+    try:
+        os.environ["PYTHONHASHSEED"] = "1"
+        first = run_fixture("canonical_hash.py")
+        os.environ["PYTHONHASHSEED"] = "2"
+        second = run_fixture("canonical_hash.py")
+    finally:
+        if original_seed is None:
+            os.environ.pop("PYTHONHASHSEED", None)
+        else:
+            os.environ["PYTHONHASHSEED"] = original_seed
+    assert_success(first)
+    assert_success(second)
+    first_hash = [line for line in first.stdout.splitlines() if line.startswith("HASH")]
+    second_hash = [line for line in second.stdout.splitlines() if line.startswith("HASH")]
+    assert first_hash == second_hash, (first_hash, second_hash)
+
+
 @test("(float, payload) values not misread as timestamps (regression)")
 def t_float_tuple():
     d = fresh_dir()
@@ -236,6 +445,50 @@ def t_cold_threaded():
         shutil.rmtree(d, ignore_errors=True)
 
 
+@test("decorator benchmark runs (--quick) and writes JSON results")
+def t_bench_decorator():
+    d = fresh_dir()
+    try:
+        output = os.path.join(d, "decorator.json")
+        proc = subprocess.run(
+            [sys.executable, os.path.join(HERE, "benchmarks", "bench_decorator.py"), "--quick", "--output", output],
+            capture_output=True,
+            text=True,
+            cwd=REPO,
+        )
+        assert_success(proc, expected_marker="wrote")
+        with open(output) as fh:
+            results = json.load(fh)["results"]
+        assert "hit_latency/cold_storage" in results, sorted(results)
+        assert "contention/in_memory/16_threads" in results, sorted(results)
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
+@test("super_hash benchmark runs (--quick) and compares against a baseline")
+def t_bench_super_hash():
+    d = fresh_dir()
+    try:
+        output = os.path.join(d, "super_hash.json")
+        script = os.path.join(HERE, "benchmarks", "bench_super_hash.py")
+        proc = subprocess.run([sys.executable, script, "--quick", "--output", output], capture_output=True, text=True, cwd=REPO)
+        assert_success(proc, expected_marker="wrote")
+        with open(output) as fh:
+            results = json.load(fh)["results"]
+        assert "super_hash/list_of_tuples" in results, sorted(results)
+        assert "hash_file/1MB" in results, sorted(results)
+        # comparing against itself can't be a regression
+        proc = subprocess.run([sys.executable, script, "--quick", "--output", output, "--compare", output, "--threshold", "1000"], capture_output=True, text=True, cwd=REPO)
+        assert_success(proc, expected_marker="compared to")
+        # the stored baseline is from a full run, --quick payloads are smaller so they can't be compared against it (or replace it)
+        proc = subprocess.run([sys.executable, script, "--quick", "--output", output, "--baseline"], capture_output=True, text=True, cwd=REPO)
+        assert proc.returncode != 0 and "full run" in proc.stderr, (proc.stdout, proc.stderr)
+        proc = subprocess.run([sys.executable, script, "--quick", "--output", output, "--update-baseline"], capture_output=True, text=True, cwd=REPO)
+        assert proc.returncode != 0 and "--update-baseline" in proc.stderr, (proc.stdout, proc.stderr)
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+
 # ---------------------------------------------------------------------------
 # main
 # ---------------------------------------------------------------------------
@@ -248,6 +501,29 @@ def main():
         t_persistence,
         t_isolation,
         t_cross_function,
+        t_incremental_persist,
+        t_exit_flush,
+        t_writer_pool,
+        t_metrics,
+        t_hooks,
+        t_admission,
+        t_eviction,
+        t_super_hash_dispatch,
+        t_super_hash_streaming,
+        t_hash_algorithm,
+        t_buffer_hash,
+        t_sampled_hash,
+        t_file_fingerprint,
+        t_file_hash_format,
+        t_directory_watch,
+        t_file_hash_workers,
+        t_inotify_watch,
+        t_identity_memo,
+        t_non_iterable_memo,
+        t_function_digest,
+        t_lazy_function_hash,
+        t_function_memo,
+        t_canonical_hash,
         t_float_tuple,
         t_keep_for_expiry,
         t_keep_for_errors,
@@ -261,6 +537,8 @@ def main():
         t_source_change,
         t_inmem_threaded,
         t_cold_threaded,
+        t_bench_decorator,
+        t_bench_super_hash,
     ]
     print(f"running {len(all_tests)} integration tests (each in a subprocess)")
     for t in all_tests: